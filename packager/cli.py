@@ -0,0 +1,393 @@
+#! /usr/bin/env python
+#
+# Command-line interface to packagebuilder: the `build_rpm` and
+# `packager` scripts. Only `argparse` and logging are imported at
+# startup; each command imports the parts of packagebuilder it uses when
+# it runs, so `--help`, `--version` and light commands like `cache stats`
+# start quickly. This is the only module that defers its imports; the
+# rest import what they need at the top, as usual, and are never
+# imported here at startup (see `test_import_is_light` in test_cli.py).
+#
+# Examples:
+#   $ packager --help
+#   $ packager plan hydrotrend --local $HOME/rpm_models
+#   $ packager plan --changed-since $HOME/models.json
+#   $ packager check-deps -m hydrotrend
+#   $ packager verify --prefix /usr/local/csdms RPMS/*/*.rpm
+#   $ packager manifest add manifest.db /srv/repos/csdms/*/*.rpm
+#   $ packager manifest query manifest.db --owns /usr/local/bin/hydrotrend
+#   $ packager cache stats
+#   $ packager cache prune --max-age 7
+#   $ packager cache prune --max-size 2000 --cache /scratch/pkgcache
+#   $ packager worker --host 0.0.0.0 --port 8642 --jobs 4
+
+import sys
+import argparse
+from packager import __version__
+from packager.core import log
+
+def linux_only():
+    '''
+    Exits unless this is a Linux system.
+    '''
+    if not sys.platform.startswith('linux'):
+        print("Error: this OS is not supported.")
+        sys.exit(1) # not Linux
+
+def guarded(func, *args, **kwargs):
+    '''
+    Calls `func`, exiting with the error's status if it raises a
+    PackagerError.
+    '''
+    from packager.core.errors import PackagerError
+    try:
+        return func(*args, **kwargs)
+    except PackagerError as e:
+        log.logger.error(str(e))
+        sys.exit(e.exit_status)
+
+def add_module_arguments(parser):
+    '''
+    Adds the options that select and locate modules.
+    '''
+    parser.add_argument("--local",
+                        help="use LOCAL path to the module files")
+    parser.add_argument("--prefix",
+                        help="use PREFIX as install path for RPM [/usr/local]")
+    parser.add_argument("--tag",
+                        help="build TAG version of the module [head]")
+    parser.add_argument("--cache",
+                        help="share downloads through the CACHE directory")
+    parser.add_argument("--changed-since", metavar="REV",
+                        help="use the modules changed since REV (a "
+                        "revision, comma-separated REPO@REV items or a "
+                        "saved index), and their dependents")
+    parser.add_argument("--save-index", metavar="FILE",
+                        help="with --changed-since, save the current index")
+
+def selected_modules(parser, args):
+    '''
+    Returns the module named on the command line, or the modules found
+    with --changed-since, in build order, as a list of (name, requires)
+    pairs, where `requires` lists the modules in the list that the
+    module depends on.
+    '''
+    if (args.module_name is None) == (args.changed_since is None):
+        parser.error("give either a module name or --changed-since")
+    if args.changed_since is None:
+        return [(args.module_name, [])]
+    from packager.rpm.build import changed_since
+    modules = guarded(changed_since, args.changed_since, args.local,
+                      args.save_index)
+    log.logger.info("Modules: " + (", ".join(m[0] for m in modules) \
+                                   or "none"))
+    return modules
+
+def build_all(modules, build):
+    '''
+    Calls `build` with the name of each module in `modules`, a list of
+    (name, requires) pairs, skipping the modules that depend on one that
+    failed or was skipped. Returns the exit status of the first failure
+    (0 if none) and the list of skipped modules.
+    '''
+    from packager.core.errors import PackagerError
+    status = 0
+    failed = set()
+    skipped = []
+    for name, requires in modules:
+        blocked = [r for r in requires if r in failed]
+        if blocked:
+            log.logger.error("Skipping " + name + ", which needs " \
+                             + ", ".join(blocked) + ".")
+            failed.add(name)
+            skipped.append(name)
+            continue
+        try:
+            build(name)
+        except PackagerError as e:
+            log.logger.error(str(e))
+            failed.add(name)
+            status = status or e.exit_status
+    return status, skipped
+
+#-----------------------------------------------------------------------------
+
+def build_rpm_parser():
+    '''
+    Returns the command-line parser for `build_rpm`.
+    '''
+    parser = argparse.ArgumentParser(
+        description="Builds a CSDMS model or tool into an RPM.")
+    parser.add_argument("module_name", nargs="?",
+                        help="the name of the model or tool to build")
+    add_module_arguments(parser)
+    parser.add_argument("--quiet", action="store_true",
+                        help="provide less detailed output [verbose]")
+    log.add_arguments(parser)
+    parser.add_argument("--timeout", type=float,
+                        help="stop a download or build after TIMEOUT seconds")
+    parser.add_argument("--executor",
+                        help="run rpmbuild with EXECUTOR: local, "
+                        "ssh://host or http://host:port [local]")
+    parser.add_argument("--buildroot", action="store_true",
+                        help="build in a clean, cached chroot (needs root)")
+    parser.add_argument("--publish",
+                        help="publish the RPMs to a yum repository in PUBLISH")
+    parser.add_argument("--manifest",
+                        help="add the RPMs to the MANIFEST database")
+    parser.add_argument("--profile",
+                        help="write profiling output to the PROFILE directory")
+    parser.add_argument('--version', action='version',
+                        version='build_rpm ' + __version__)
+    return parser
+
+def build_rpm(argv=None):
+    '''
+    Accepts command-line arguments and passes them to an instance of
+    BuildRPM for each module to build.
+    '''
+    linux_only()
+    parser = build_rpm_parser()
+    args = parser.parse_args(argv)
+    log.configure("WARNING" if args.quiet else args.log_level, args.log_json)
+    if args.buildroot and args.executor not in (None, "local"):
+        parser.error("--buildroot builds on this host; it can't be used "
+                     "with a remote --executor")
+    modules = selected_modules(parser, args)
+
+    from packager.rpm.build import BuildRPM
+    from packager.rpm import executor as executors
+    from packager.core.profiling import profiled
+    def build(name):
+        with profiled("build_rpm-" + name, args.profile):
+            BuildRPM(name, args.tag, args.local, args.prefix,
+                     args.quiet, args.cache, timeout=args.timeout,
+                     executor=executors.from_url(args.executor),
+                     buildroot=args.buildroot,
+                     publish_dir=args.publish,
+                     manifest=args.manifest).run()
+    status, skipped = build_all(modules, build)
+    if skipped:
+        log.logger.error("Skipped: " + ", ".join(skipped))
+    sys.exit(status)
+
+#-----------------------------------------------------------------------------
+
+def plan(args):
+    '''
+    Locates each module and runs its preflight checks, without building.
+    '''
+    from packager.rpm.build import BuildRPM
+    for name, requires in selected_modules(args.parser, args):
+        builder = BuildRPM(name, args.tag, args.local, args.prefix,
+                           cache_dir=args.cache)
+        try:
+            guarded(builder.plan)
+            print("{0} {1}".format(name, builder.module.version))
+            print("  location: " + builder.module.location)
+            print("  dependencies: " + (builder.module.dependencies or "none"))
+            guarded(builder.preflight)
+        finally:
+            builder.cleanup()
+
+def check_deps(args):
+    '''
+    Checks that the packages needed to build a model are installed.
+    '''
+    from packager.core.check_dependencies import CheckDependencies
+    from packager.core.profiling import profiled
+    name = "check_dependencies" if args.model is None \
+           else "check_dependencies-" + args.model
+    with profiled(name, args.profile):
+        guarded(CheckDependencies(args.model).run)
+
+def cache_stats(args):
+    '''
+    Prints the number and size of the entries in each cache bucket.
+    '''
+    from packager.core.cache import Cache, buckets
+    cache = Cache(args.cache)
+    stats = cache.stats()
+    print("Cache: " + cache.root)
+    for bucket in buckets:
+        count, size = stats[bucket]
+        print(" - {0}: {1} entries, {2:.1f} MB".format(bucket, count,
+                                                       size / 1e6))
+
+def cache_prune(args):
+    '''
+    Removes old entries from the cache, or the oldest entries when the
+    cache is too large.
+    '''
+    from packager.core.cache import Cache
+    cache = Cache(args.cache)
+    max_age = None if args.max_age is None else args.max_age * 86400
+    max_size = None if args.max_size is None else args.max_size * 1e6
+    removed = cache.prune(max_age=max_age, max_size=max_size)
+    for path in removed:
+        print("Removed " + path)
+    print("Removed {0} entries.".format(len(removed)))
+
+def verify_rpms(args):
+    '''
+    Checks the digests of RPMs and that their files are under a prefix.
+    '''
+    from packager.rpm.verify import verify
+    guarded(verify, args.rpms, args.prefix,
+            check_payload=not args.headers_only)
+
+def manifest_add(args):
+    '''
+    Adds RPMs to a manifest.
+    '''
+    from packager.rpm.manifest import Manifest
+    manifest = Manifest(args.manifest)
+    try:
+        headers = guarded(manifest.add_files, args.rpms)
+    finally:
+        manifest.close()
+    print("Added {0} packages.".format(len(headers)))
+
+def manifest_query(args):
+    '''
+    Prints the packages in a manifest that match a query, or the files
+    in a package.
+    '''
+    from packager.rpm.manifest import Manifest
+    manifest = Manifest(args.manifest)
+    try:
+        if args.files is not None:
+            lines = [u"{0:o} {1:10d} {2} {3}".format(mode, size, digest, path)
+                     for path, size, mode, digest in manifest.files(args.files)]
+        elif args.owns is not None:
+            lines = manifest.owners(args.owns)
+        elif args.provides is not None:
+            lines = manifest.whatprovides(args.provides)
+        elif args.requires is not None:
+            lines = manifest.whatrequires(args.requires)
+        else:
+            lines = [nevra + u" " + path
+                     for nevra, path in manifest.packages(args.name)]
+    finally:
+        manifest.close()
+    for line in lines:
+        print(line.encode("utf-8"))
+
+def worker(args):
+    '''
+    Runs a build worker for `build_rpm --executor http://...`.
+    '''
+    from packager.rpm.worker import serve
+    serve(args.host, args.port, args.jobs, args.workdir)
+
+def packager_parser():
+    '''
+    Returns the command-line parser for `packager`.
+    '''
+    parser = argparse.ArgumentParser(
+        description="Utilities for building CSDMS models and tools.")
+    parser.add_argument('--version', action='version',
+                        version='packager ' + __version__)
+    subparsers = parser.add_subparsers(title="commands")
+
+    plan_parser = subparsers.add_parser("plan",
+        help="locate modules and check their files without building")
+    plan_parser.add_argument("module_name", nargs="?",
+                             help="the name of the model or tool to check")
+    add_module_arguments(plan_parser)
+    plan_parser.set_defaults(func=plan, parser=plan_parser)
+
+    deps_parser = subparsers.add_parser("check-deps",
+        help="check that the packages a model needs are installed")
+    deps_parser.add_argument("-m", "--model",
+                             help="the name of the model to check")
+    deps_parser.add_argument("--profile",
+        help="write profiling output to the PROFILE directory")
+    deps_parser.set_defaults(func=check_deps)
+
+    verify_parser = subparsers.add_parser("verify",
+        help="check the digests and file paths of RPMs")
+    verify_parser.add_argument("rpms", nargs="+", metavar="RPM",
+                               help="an RPM file to check")
+    verify_parser.add_argument("--prefix", default="/usr/local",
+        help="require files to be under PREFIX [/usr/local]")
+    verify_parser.add_argument("--headers-only", action="store_true",
+        help="don't read the payloads (faster)")
+    verify_parser.set_defaults(func=verify_rpms)
+
+    manifest_parser = subparsers.add_parser("manifest",
+        help="add RPMs to or query a manifest database")
+    manifest_subparsers = manifest_parser.add_subparsers(
+        title="manifest commands")
+
+    add_parser = manifest_subparsers.add_parser("add",
+                                                help="add RPMs to a manifest")
+    add_parser.add_argument("manifest", help="the manifest database")
+    add_parser.add_argument("rpms", nargs="+", metavar="RPM",
+                            help="an RPM file to add")
+    add_parser.set_defaults(func=manifest_add)
+
+    query_parser = manifest_subparsers.add_parser("query",
+        help="list packages in a manifest")
+    query_parser.add_argument("manifest", help="the manifest database")
+    query = query_parser.add_mutually_exclusive_group()
+    query.add_argument("--name", help="list the packages named NAME")
+    query.add_argument("--owns", metavar="PATH",
+                       help="list the packages that contain PATH")
+    query.add_argument("--provides", metavar="CAPABILITY",
+                       help="list the packages that provide CAPABILITY")
+    query.add_argument("--requires", metavar="CAPABILITY",
+                       help="list the packages that require CAPABILITY")
+    query.add_argument("--files", metavar="NEVRA",
+                       help="list the files in package NEVRA")
+    query_parser.set_defaults(func=manifest_query)
+
+    cache_parser = subparsers.add_parser("cache",
+                                         help="inspect or prune the cache")
+    cache_subparsers = cache_parser.add_subparsers(title="cache commands")
+
+    stats_parser = cache_subparsers.add_parser("stats",
+                                               help="show cache usage")
+    stats_parser.set_defaults(func=cache_stats)
+
+    prune_parser = cache_subparsers.add_parser("prune",
+                                               help="remove cache entries")
+    prune_parser.add_argument("--max-age", type=float,
+                              help="remove entries older than MAX_AGE days")
+    prune_parser.add_argument("--max-size", type=float,
+                              help="shrink the cache to MAX_SIZE MB")
+    prune_parser.set_defaults(func=cache_prune)
+
+    for p in (stats_parser, prune_parser):
+        p.add_argument("--cache",
+                       help="use CACHE directory [~/.cache/packagebuilder]")
+
+    worker_parser = subparsers.add_parser("worker",
+                                          help="run a remote build worker")
+    worker_parser.add_argument("--host", default="127.0.0.1",
+                               help="listen on HOST [127.0.0.1]")
+    worker_parser.add_argument("--port", type=int, default=8642,
+                               help="listen on PORT [8642]")
+    worker_parser.add_argument("--jobs", type=int, default=1,
+                               help="run up to JOBS builds at once [1]")
+    worker_parser.add_argument("--workdir",
+                               help="build in temporary directories in WORKDIR")
+    worker_parser.set_defaults(func=worker)
+
+    for p in (plan_parser, deps_parser, verify_parser, worker_parser):
+        log.add_arguments(p)
+    return parser
+
+def main(argv=None):
+    '''
+    Accepts command-line arguments and runs the requested subcommand.
+    '''
+    args = packager_parser().parse_args(argv)
+    if hasattr(args, "log_level"):
+        log.configure(args.log_level, args.log_json)
+    if args.func in (plan, check_deps):
+        linux_only()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+#! /usr/bin/env python
+#
+# A shared cache for repository archives, unpacked module directories,
+# source tarballs, buildroot images and preflight check results. The
+# cache may be used by several processes at once, on one host or on many
+# hosts sharing an NFS-mounted directory.
+#
+# Entries are filled under a per-key file lock, so only one process
+# fills a missing entry while the others wait, and are moved into place
+# with an atomic rename, so a reader never sees a partial entry.
+#
+# An entry used for a long time (e.g., a buildroot image mounted for a
+# build) is protected with `hold`, which takes a shared lock that keeps
+# it from being refreshed or pruned. A consumer that only needs the
+# entry's contents takes a private copy with `copy` instead.
+
+import os
+import errno
+import fcntl
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+buckets = ("repos", "modules", "sources", "buildroots", "preflight")
+default_max_age = 3600 # seconds
+
+_tmp_prefix = ".tmp-"
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+_holds = {} # use-lock file -> [open file, count], for this process
+
+def default_root():
+    '''
+    Returns the default cache directory, `$PACKAGER_CACHE` if set,
+    otherwise `~/.cache/packagebuilder`.
+    '''
+    root = os.getenv("PACKAGER_CACHE")
+    if root is None:
+        root = os.path.join(os.path.expanduser("~"), ".cache",
+                            "packagebuilder")
+    return root
+
+def _makedirs(path):
+    '''
+    Creates a directory and its parents, ignoring a directory that
+    already exists (it may have been created by another process).
+    '''
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+def _size(path):
+    '''
+    Returns the size, in bytes, of a file or a directory tree.
+    '''
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for fname in filenames:
+            fpath = os.path.join(dirpath, fname)
+            if not os.path.islink(fpath):
+                total += os.path.getsize(fpath)
+    return total
+
+def _thread_lock(lock_file):
+    '''
+    Returns the thread lock paired with a lock file.
+    '''
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(lock_file, threading.Lock())
+
+@contextmanager
+def file_lock(lock_file):
+    '''
+    Holds an exclusive lock on the given file. The lock is a POSIX record
+    lock, which is honored across hosts on NFS, and is paired with a
+    thread lock, since record locks are per-process.
+    '''
+    with _thread_lock(lock_file):
+        with open(lock_file, "a") as f:
+            fcntl.lockf(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(f, fcntl.LOCK_UN)
+
+def _remove(path):
+    '''
+    Removes a file or a directory tree.
+    '''
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+class Cache(object):
+    '''
+    A directory of cached files and directories, grouped into buckets
+    and addressed by key.
+    '''
+    def __init__(self, root=None):
+        self._root = default_root() if root is None else \
+                     os.path.abspath(os.path.expanduser(root))
+        for bucket in buckets + ("locks",):
+            _makedirs(os.path.join(self._root, bucket))
+
+    @property
+    def root(self):
+        '''
+        The top-level cache directory.
+        '''
+        return self._root
+
+    def path(self, bucket, key):
+        '''
+        Returns the path to the entry for `key` in the given bucket. The
+        entry may not exist.
+        '''
+        if bucket not in buckets:
+            raise ValueError("Unknown cache bucket: " + bucket)
+        return os.path.join(self._root, bucket, key.replace("/", "_"))
+
+    @contextmanager
+    def lock(self, bucket, key):
+        '''
+        Holds an exclusive lock on the entry for `key` (see `file_lock`).
+        '''
+        name = os.path.basename(self.path(bucket, key))
+        with file_lock(os.path.join(self._root, "locks", \
+                                    bucket + "-" + name)):
+            yield
+
+    def _use_file(self, bucket, key):
+        return os.path.join(self._root, "locks", bucket + "-" \
+                            + os.path.basename(self.path(bucket, key)) + ".use")
+
+    @contextmanager
+    def hold(self, bucket, key):
+        '''
+        Marks the entry for `key` as in use, so that it isn't refreshed
+        or removed, and yields its path. The entry may not exist yet.
+        Holds are shared: any number of threads and processes may hold
+        an entry at once.
+        '''
+        use_file = self._use_file(bucket, key)
+        with _thread_lock(use_file):
+            if use_file not in _holds:
+                f = open(use_file, "a+")
+                fcntl.lockf(f, fcntl.LOCK_SH)
+                _holds[use_file] = [f, 0]
+            _holds[use_file][1] += 1
+        try:
+            yield self.path(bucket, key)
+        finally:
+            with _thread_lock(use_file):
+                _holds[use_file][1] -= 1
+                if _holds[use_file][1] == 0:
+                    _holds.pop(use_file)[0].close() # releases the lock
+
+    @contextmanager
+    def _unused(self, bucket, key):
+        '''
+        Yields True, holding off new holds, if the entry for `key` isn't
+        held by any thread or process, or False if it is.
+        '''
+        use_file = self._use_file(bucket, key)
+        with _thread_lock(use_file):
+            if use_file in _holds:
+                yield False
+                return
+            with open(use_file, "a+") as f:
+                try:
+                    fcntl.lockf(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError as e:
+                    if e.errno not in (errno.EACCES, errno.EAGAIN):
+                        raise
+                    yield False
+                    return
+                yield True
+
+    def is_fresh(self, path, max_age=None):
+        '''
+        Returns True if the entry at `path` exists and, if `max_age` is
+        given, is no older than `max_age` seconds.
+        '''
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return False
+        return max_age is None or (time.time() - mtime) <= max_age
+
+    def get(self, bucket, key, fill, max_age=None):
+        '''
+        Returns the path to the entry for `key`, calling `fill` to create
+        it if it is missing or older than `max_age` seconds. `fill` is
+        passed a staging path, where it must create a file or directory;
+        the result is then renamed into place. If `fill` creates nothing,
+        nothing is cached and None is returned. An old entry that is held
+        (see `hold`) is returned as it is, rather than refreshed.
+        '''
+        target = self.path(bucket, key)
+        if self.is_fresh(target, max_age):
+            return target
+        with self.lock(bucket, key):
+            if self.is_fresh(target, max_age): # filled while we waited
+                return target
+            staging_dir = tempfile.mkdtemp(prefix=_tmp_prefix, \
+                                           dir=os.path.dirname(target))
+            try:
+                with self._unused(bucket, key) as unused:
+                    if os.path.lexists(target) and not unused:
+                        return target
+                    staged = os.path.join(staging_dir, \
+                                          os.path.basename(target))
+                    fill(staged)
+                    if not os.path.lexists(staged):
+                        return None
+                    os.utime(staged, None)
+                    if os.path.lexists(target):
+                        os.rename(target, os.path.join(staging_dir, "stale"))
+                    os.rename(staged, target)
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+        return target
+
+    def copy(self, bucket, key, fill, dest, max_age=None):
+        '''
+        Like `get`, but makes a private copy of the entry at `dest`, which
+        later refreshes of the entry don't affect. Files are hard linked
+        when possible; directories are copied. Returns `dest`, or None if
+        `fill` creates nothing.
+        '''
+        while True:
+            path = self.get(bucket, key, fill, max_age)
+            if path is None:
+                return None
+            with self.hold(bucket, key):
+                if not os.path.lexists(path):
+                    continue # removed before we held it
+                if os.path.isdir(path):
+                    shutil.copytree(path, dest, symlinks=True)
+                else:
+                    try:
+                        os.link(path, dest)
+                    except OSError:
+                        shutil.copy2(path, dest)
+                return dest
+
+    def entries(self, bucket):
+        '''
+        Returns a list of (path, size, mtime) tuples for the entries in
+        the given bucket.
+        '''
+        bucket_dir = os.path.join(self._root, bucket)
+        items = []
+        for name in sorted(os.listdir(bucket_dir)):
+            if name.startswith(_tmp_prefix):
+                continue
+            path = os.path.join(bucket_dir, name)
+            try:
+                items.append((path, _size(path), os.path.getmtime(path)))
+            except OSError:
+                pass # removed by another process
+        return items
+
+    def stats(self):
+        '''
+        Returns a dict mapping each bucket name to a tuple of the number
+        of entries in the bucket and their total size in bytes.
+        '''
+        result = {}
+        for bucket in buckets:
+            items = self.entries(bucket)
+            result[bucket] = (len(items), sum(item[1] for item in items))
+        return result
+
+    def remove(self, bucket, key):
+        '''
+        Removes the entry for `key`, waiting for any process filling it.
+        An entry that is held (see `hold`) isn't removed. Returns True if
+        the entry was removed.
+        '''
+        with self.lock(bucket, key):
+            with self._unused(bucket, key) as unused:
+                if unused:
+                    _remove(self.path(bucket, key))
+                return unused
+
+    def prune(self, max_age=None, max_size=None):
+        '''
+        Removes entries older than `max_age` seconds, then removes the
+        oldest remaining entries until the cache holds no more than
+        `max_size` bytes. Entries that are held are kept. Staging
+        directories left by interrupted fills are also removed. Returns a
+        list of the paths removed.
+        '''
+        now = time.time()
+        removed = []
+        kept = []
+        for bucket in buckets:
+            bucket_dir = os.path.join(self._root, bucket)
+            for name in os.listdir(bucket_dir):
+                path = os.path.join(bucket_dir, name)
+                if name.startswith(_tmp_prefix) and \
+                        not self.is_fresh(path, default_max_age):
+                    _remove(path)
+            for path, size, mtime in self.entries(bucket):
+                if max_age is not None and (now - mtime) > max_age \
+                        and self.remove(bucket, os.path.basename(path)):
+                    removed.append(path)
+                else:
+                    kept.append((mtime, size, bucket, path))
+        if max_size is not None:
+            total = sum(item[1] for item in kept)
+            for mtime, size, bucket, path in sorted(kept):
+                if total <= max_size:
+                    break
+                if self.remove(bucket, os.path.basename(path)):
+                    removed.append(path)
+                    total -= size
+        return removed
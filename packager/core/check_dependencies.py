@@ -6,21 +6,36 @@
 # Usage:
 #   $ python check_dependencies.py --help
 #   $ python check_dependencies.py -m "hydrotrend"
+#   $ packager check-deps -m hydrotrend
 #
 # Mark Piper (mark.piper@colorado.edu)
 
 import sys
 import os.path
-from subprocess import call
-import argparse
+import multiprocessing
+from packager.core import log
+from packager.core.runner import Runner
+from packager.core.flavor import debian_check
+from packager.core.errors import DependencyError
+
+logger = log.get_logger(__name__)
 
 class CheckDependencies(object):
     '''
-    Checks the dependencies for building an RPM for a given model.
+    Checks the dependencies for building an RPM for a given model. The
+    constructor only records the model; call `run` to do the check.
     '''
     def __init__(self, model_name):
         self.dirname = os.path.dirname(os.path.realpath(__file__))
         self.model_name = model_name
+        self.runner = Runner(max_jobs=multiprocessing.cpu_count())
+
+    def run(self):
+        '''
+        Reads the dependencies for the model and checks that they're all
+        installed. Returns the list of packages checked, or raises
+        DependencyError if any are missing.
+        '''
         self.debian_check()
 
         # Read dependencies for all models.
@@ -46,13 +61,14 @@ class CheckDependencies(object):
 
         # Check that all the dependencies are met.
         self.check()
-        print("All required packages are installed.")
+        logger.info("All required packages are installed.")
+        return self.dependencies
 
     def debian_check(self):
         ''' 
         True if this is a Debian-based Linux system.
         '''
-        self.is_debian = (call(["test", "-f", "/etc/debian_version"]) == 0)
+        self.is_debian = debian_check()
 
     def read(self, fname):
         '''
@@ -67,47 +83,43 @@ class CheckDependencies(object):
 
     def query_package_tool(self, package):
         '''
-        Calls the distro-specific package tool to query whether the given
-        package is installed.
+        Starts the distro-specific package tool to query whether the given
+        package is installed. Returns the Job running the query.
         '''
         if self.is_debian:
-            return call(["dpkg-query", "-W", package])
+            return self.runner.start(["dpkg-query", "-W", package], \
+                                     log=logger, report=False)
         else:
-            print(" - " + package)
-            return call(["rpm", "-q", "--quiet", package])
+            logger.info(" - " + package)
+            return self.runner.start(["rpm", "-q", "--quiet", package], \
+                                     log=logger, report=False)
 
     def check(self):
         '''
-        Performs the checks for the required packages.
+        Performs the checks for the required packages, running several
+        queries at once. Raises DependencyError listing all the packages
+        that are missing.
         '''
-        print("Checking " + self.distro + "-compatible dependencies:")
-        for package in self.dependencies:
-            ret = self.query_package_tool(package)
-            if ret > 0:
-                print("The package '" + package + "' is required. "
-                      "Install it with:\n$ sudo " + self.package_tool
-                      + " install " + package)
-                sys.exit(1) # package not installed
+        logger.info("Checking " + self.distro + "-compatible dependencies:")
+        jobs = [self.query_package_tool(p) for p in self.dependencies]
+        missing = []
+        for package, job in zip(self.dependencies, jobs):
+            if job.wait() != 0:
+                missing.append(package)
+        if len(missing) > 0:
+            raise DependencyError("The packages '" + "', '".join(missing) \
+                + "' are required. Install them with:\n$ sudo " \
+                + self.package_tool + " install " + " ".join(missing), missing)
 
 #-----------------------------------------------------------------------------
 
 def main():
     '''
     Accepts command-line arguments and passes them to an instance of 
-    CheckDependencies.
+    CheckDependencies (see `packager check-deps`).
     '''
-    # Allow only Linuxen.
-    if not sys.platform.startswith('linux'):
-        print("Error: this OS is not supported.")
-        sys.exit(1) # not Linux
-
-    # Which model is being checked?
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-m", "--model",
-                        help="the name of the model to check")
-    args = parser.parse_args()
-
-    CheckDependencies(args.model)
+    from packager.cli import main
+    main(["check-deps"] + sys.argv[1:])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+#
+# Exceptions raised by packagebuilder. Each carries the exit status that
+# the command-line tools use when they catch it.
+
+class PackagerError(Exception):
+    '''
+    Base class for packagebuilder errors.
+    '''
+    exit_status = 1
+
+class ModuleNotFound(PackagerError):
+    '''
+    The setup files for a module can't be located.
+    '''
+    exit_status = 1 # can't find module
+
+class SourceError(PackagerError):
+    '''
+    The source for a module can't be retrieved.
+    '''
+    exit_status = 2 # can't access source
+
+class PreflightError(PackagerError):
+    '''
+    A module's build inputs are invalid. `problems` lists what's wrong.
+    '''
+    exit_status = 1 # invalid module files
+
+    def __init__(self, problems):
+        super(PreflightError, self).__init__(
+            "Preflight check failed:\n - " + "\n - ".join(problems))
+        self.problems = list(problems)
+
+class BuildError(PackagerError):
+    '''
+    A package can't be built from a module.
+    '''
+    exit_status = 2 # can't build RPM
+
+class ArtifactError(PackagerError):
+    '''
+    Built packages are unreadable or don't match what was expected.
+    `problems` lists what's wrong.
+    '''
+    exit_status = 2 # bad RPM
+
+    def __init__(self, problems):
+        super(ArtifactError, self).__init__(
+            "Artifact check failed:\n - " + "\n - ".join(problems))
+        self.problems = list(problems)
+
+class PublishError(PackagerError):
+    '''
+    Built packages can't be published to a repository.
+    '''
+    exit_status = 3 # can't publish RPM
+
+class DependencyError(PackagerError):
+    '''
+    Packages required to build a module aren't installed.
+    '''
+    exit_status = 1 # package not installed
+
+    def __init__(self, message, packages=()):
+        super(DependencyError, self).__init__(message)
+        self.packages = list(packages)
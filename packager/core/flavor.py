@@ -1,7 +1,7 @@
-from subprocess import call
+import os
 
 def debian_check():
     ''' 
     Returns True if this is a Debian-based Linux system.
     '''
-    return (call(["test", "-f", "/etc/debian_version"]) == 0)
+    return os.path.isfile("/etc/debian_version")
@@ -0,0 +1,132 @@
+#! /usr/bin/env python
+#
+# Logging and progress reporting for packagebuilder. Messages go through
+# the standard `logging` module, as plain text or as JSON lines, and
+# external commands are run with their output captured and logged line
+# by line (see `runner`), so each line carries a timestamp.
+
+import sys
+import time
+import json
+import logging
+
+logger = logging.getLogger("packager")
+logger.addHandler(logging.NullHandler())
+
+_record_attrs = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__)
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Formats each log record as a single line of JSON.
+    '''
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S",
+                                  time.gmtime(record.created))
+                    + ".{0:03d}Z".format(int(record.msecs)),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            }
+        for key, value in record.__dict__.items():
+            if key not in _record_attrs and key != "message":
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, sort_keys=True)
+
+def get_logger(name):
+    '''
+    Returns the logger for a packagebuilder module, given its `__name__`.
+    '''
+    if not name.startswith("packager."):
+        name = "packager." + name
+    return logging.getLogger(name)
+
+def configure(level="INFO", json_lines=False, stream=None):
+    '''
+    Sends packagebuilder log messages at or above `level` to `stream`
+    (default is stdout), as timestamped lines of text or as JSON lines.
+    '''
+    handler = logging.StreamHandler(sys.stdout if stream is None else stream)
+    if json_lines:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s",
+                                               "%Y-%m-%d %H:%M:%S"))
+    for h in list(logger.handlers):
+        if not isinstance(h, logging.NullHandler):
+            logger.removeHandler(h)
+    logger.addHandler(handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+def add_arguments(parser):
+    '''
+    Adds the logging options to a command-line parser.
+    '''
+    parser.add_argument("--log-level", default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="report messages at LOG_LEVEL and above [INFO]")
+    parser.add_argument("--log-json", action="store_true",
+                        help="write log messages as JSON lines")
+
+def _format_bytes(nbytes):
+    for unit in ("B", "kB", "MB", "GB"):
+        if nbytes < 1000.0 or unit == "GB":
+            return "{0:.1f} {1}".format(nbytes, unit)
+        nbytes /= 1000.0
+
+class Progress(object):
+    '''
+    Reports the bytes processed by a long-running step, and the rate at
+    which they're processed, at most once every `interval` seconds.
+    '''
+    def __init__(self, label, total=None, log=None, interval=1.0):
+        self.label = label
+        self.total = total
+        self.log = logger if log is None else log
+        self.interval = interval
+        self.nbytes = 0
+        self.start = self.last = time.time()
+
+    def update(self, nbytes):
+        '''
+        Adds `nbytes` to the count of bytes processed.
+        '''
+        self.nbytes += nbytes
+        now = time.time()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.report()
+
+    def hook(self, block_count, block_size, total_size):
+        '''
+        A progress hook for `urllib.urlretrieve`.
+        '''
+        if total_size > 0:
+            self.total = total_size
+        self.update(block_size if block_count > 0 else 0)
+
+    def report(self, finished=False):
+        '''
+        Logs the progress so far.
+        '''
+        elapsed = max(time.time() - self.start, 1e-6)
+        nbytes = self.nbytes
+        if finished and self.total is not None:
+            nbytes = self.total
+        msg = self.label + ": " + _format_bytes(nbytes)
+        if self.total is not None and not finished:
+            msg += " of " + _format_bytes(self.total)
+        msg += " (" + _format_bytes(nbytes / elapsed) + "/s)"
+        if finished:
+            msg += " in {0:.1f} s".format(elapsed)
+        self.log.info(msg, extra={"bytes": nbytes, "total": self.total,
+                                  "elapsed": round(elapsed, 3),
+                                  "rate": round(nbytes / elapsed, 1)})
+
+    def finish(self):
+        '''
+        Logs the final byte count and rate.
+        '''
+        self.report(finished=True)
@@ -5,31 +5,43 @@
 #
 # Mark Piper (mark.piper@colorado.edu)
 
-import sys, os, shutil
-from subprocess import call
+import os, shutil
+import tarfile
 import tempfile
 import string
 from packager.core import repo_tools as repo
+from packager.core.cache import default_max_age
+from packager.core.log import get_logger, Progress
+from packager.core import runner
+from packager.core.errors import ModuleNotFound, SourceError
+
+logger = get_logger(__name__)
 
 class Module(object):
     '''
-    Represents a CSDMS model or tool.
+    Represents a CSDMS model or tool. Raises ModuleNotFound if the
+    module's setup files can't be located. If given, `timeout` limits the
+    time, in seconds, allowed to download the module source.
     '''
-    def __init__(self, module_name, module_version, local_dir):
+    def __init__(self, module_name, module_version, local_dir, cache=None, \
+                 timeout=None):
         self._name = module_name
         self._version = "head" if module_version is None else module_version
+        self.cache = cache
+        self.timeout = timeout
 
-        # Get module setup files 1) from GitHub and store in a tmp directory,
-        # or 2) from a local directory.
+        # Get module setup files 1) from GitHub, through the cache if
+        # given, and store in a tmp directory, or 2) from a local directory.
         if local_dir is None:
             self.tmpdir = tempfile.mkdtemp()
-            self._location = repo.get_module(self._name, dest=self.tmpdir)
+            self._location = repo.get_module(self._name, dest=self.tmpdir, \
+                                             cache=cache)
         else:
             self._location = self.get_local_dir(local_dir)
         if self._location is None:
-            print("The module '" + self._name + "' cannot be located.")
             self.cleanup()
-            sys.exit(1) # can't find module
+            raise ModuleNotFound("The module '" + self._name \
+                                 + "' cannot be located.")
 
         # Paths to module setup files.
         self.deps_file = os.path.join(self._location, "dependencies.txt")
@@ -79,7 +91,7 @@ class Module(object):
         elif os.path.isdir(os.path.join(explocdir, self._name)):
             return os.path.join(explocdir, self._name)
         else:
-            print("The specified \"--local\" directory cannot be found.")
+            logger.error("The specified \"--local\" directory cannot be found.")
 
     def get_dependencies(self):
         '''
@@ -91,60 +103,166 @@ class Module(object):
         else:
             self._dependencies = "rpm" # XXX workaround
 
-    def get_source(self, debug=False):
+    def get_source(self, debug=False, dest=None):
         '''
         Retrieves the module source from an external repository, and, if
         needed, makes a tarball from the source. The path to the tarball
         is returned. If the tarball is already present, immediately return
-        the path to the tarball.
+        the path to the tarball. Raises SourceError if the source can't be
+        retrieved. With a cache, the tarball is taken from, or
+        stored in, the cache; untagged ("head") sources expire. Otherwise,
+        the tarball is kept in a local module directory, for reuse by
+        later builds. If `dest` is given, the tarball is linked into that
+        directory, or, for a module downloaded to a temporary directory,
+        written straight into it.
         '''
+        if self.cache is not None:
+            max_age = default_max_age if self._version == "head" else None
+            fill = lambda staged: self.fetch_source(staged, debug)
+            if dest is None:
+                self.tarball = self.cache.get("sources", \
+                    self.tarball_name(), fill, max_age)
+            else:
+                target = os.path.join(dest, self.tarball_name())
+                if os.path.lexists(target):
+                    os.remove(target)
+                self.tarball = self.cache.copy("sources", \
+                    self.tarball_name(), fill, target, max_age)
+            if self.tarball is None:
+                raise SourceError("Unable to download module source.")
+            return self.tarball
+
         if self.is_tarball_present():
-            print("Source tarball for " + self._name + " is present.")
+            logger.info("Source tarball for " + self._name + " is present.")
+            if dest is not None:
+                self.tarball = self.link_tarball(dest)
             return self.tarball
-        
-        print("Getting " + self._name + " source.")
+
+        if dest is not None and hasattr(self, "tmpdir"):
+            self.tarball = os.path.join(dest, self.tarball_name())
+        self.fetch_source(self.tarball, debug)
+        if dest is not None and not hasattr(self, "tmpdir"):
+            self.tarball = self.link_tarball(dest)
+        return self.tarball
+
+    def link_tarball(self, dest):
+        '''
+        Hard links the source tarball into the directory `dest`, copying
+        it if a link can't be made (e.g., across filesystems). Returns the
+        path to the new tarball.
+        '''
+        target = os.path.join(dest, os.path.basename(self.tarball))
+        if os.path.lexists(target):
+            os.remove(target)
+        try:
+            os.link(self.tarball, target)
+        except OSError:
+            shutil.copy(self.tarball, target)
+        return target
+
+    def fetch_source(self, tarball, debug=False):
+        '''
+        Runs the command in the module's "source.txt" file to download the
+        module source, making the tarball `tarball` from it if needed. The
+        tarball is written under a temporary name and renamed when it's
+        complete, so a partial download is never mistaken for the source.
+        '''
+        logger.info("Getting " + self._name + " source.")
         with open(self.source_file, "r") as f:
             cmd = f.readline().strip()
-        
+        self.tarball = tarball
+
         # Fragile. This needs improvement.
         getter = cmd.split()[0]
         if getter == "wget":
-            self.source_target = "-N -O" + self.tarball
+            self.source_target = "-N -O" + self.tarball + ".part"
         else:
-            self.source_target = \
-                os.path.join(self._location, self._name + "-" + self._version)
+            self.source_target = os.path.join(os.path.dirname(self.tarball), \
+                                              self._name + "-" + self._version)
 
         cmd += " " + self.source_target
-        if debug: print(cmd)
-        ret = call(cmd, shell=True)
-        if ret != 0:
-            print("Unable to download module source.")
-            sys.exit(2) # can't access source
+        if debug: logger.debug(cmd)
+        job = runner.default.start(cmd, shell=True, log=logger, \
+                                   timeout=self.timeout)
+        try:
+            ret = job.wait()
+        except OSError as e:
+            raise SourceError("Unable to download module source: " + str(e))
+        if job.timed_out or ret != 0:
+            self.discard_source()
+            if job.timed_out:
+                raise SourceError("Timed out downloading module source.")
+            raise SourceError("Unable to download module source.")
 
         if os.path.isdir(self.source_target):
             self.make_tarball()
+        elif os.path.isfile(self.tarball + ".part"):
+            os.rename(self.tarball + ".part", self.tarball)
+        else:
+            raise SourceError("The command in source.txt didn't download " \
+                              "the module source.")
 
-        if debug: print(self.tarball)
-        return self.tarball
+        if debug: logger.debug(self.tarball)
+
+    def tarball_name(self):
+        '''
+        Returns the file name of the module's source tarball.
+        '''
+        return self._name + "-" + self._version + ".tar.gz"
 
     def is_tarball_present(self):
         '''
         Returns True if the source tarball is present.
         '''
-        self.tarball = os.path.join( \
-            self._location, self._name + "-" + self._version + ".tar.gz")
+        self.tarball = os.path.join(self._location, self.tarball_name())
         return os.path.isfile(self.tarball)
 
     def make_tarball(self):
         '''
-        Makes a tarball from the module source.
+        Makes a tarball from the module source. Files are streamed into
+        the compressed tarball and deleted from the checkout as they're
+        added, so the source and the tarball never both exist in full.
+        If the tarball can't be made, the partial tarball and the checkout
+        are deleted, so the source can be fetched again, and SourceError
+        is raised.
         '''
-        print("Making tarball.")
-        self.tarball = shutil.make_archive(self.source_target, 'gztar', \
-                                           self._location, \
-                                           os.path.basename(self.source_target))
+        logger.info("Making tarball.")
+        parent = os.path.dirname(self.source_target)
+        partial = self.tarball + ".part"
+        progress = Progress("Compressed", log=logger)
+        try:
+            tar = tarfile.open(partial, "w:gz")
+            try:
+                for dirpath, dirnames, filenames in \
+                        os.walk(self.source_target):
+                    tar.add(dirpath, os.path.relpath(dirpath, parent), \
+                            recursive=False)
+                    links = [d for d in dirnames \
+                             if os.path.islink(os.path.join(dirpath, d))]
+                    for fname in sorted(filenames + links):
+                        fpath = os.path.join(dirpath, fname)
+                        tar.add(fpath, os.path.relpath(fpath, parent))
+                        progress.update(os.lstat(fpath).st_size)
+                        os.remove(fpath)
+                    dirnames[:] = sorted(set(dirnames) - set(links))
+            finally:
+                tar.close()
+        except (EnvironmentError, tarfile.TarError) as e:
+            self.discard_source()
+            raise SourceError("Unable to make tarball: " + str(e))
+        progress.finish()
+        os.rename(partial, self.tarball)
         shutil.rmtree(self.source_target)
 
+    def discard_source(self):
+        '''
+        Deletes a partial tarball and checkout left by a failed download.
+        '''
+        if os.path.isfile(self.tarball + ".part"):
+            os.remove(self.tarball + ".part")
+        if os.path.isdir(self.source_target):
+            shutil.rmtree(self.source_target)
+
     def cleanup(self):
         '''
         Deletes the directory used to store the downloaded archives from
@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+#
+# Profiles a packagebuilder run. The Python side is recorded with
+# cProfile; each external command started by the runner is recorded
+# with its wall time, CPU time and maximum resident set size. When the
+# run ends, three files are written to the output directory:
+#
+#   <name>.prof             cProfile dump (for pstats, snakeviz, etc.)
+#   <name>.subprocess.jsonl one JSON line per external command
+#   <name>.folded           collapsed stacks for flamegraph.pl/speedscope
+#
+# Python stacks in the folded file are weighted by wall time, in
+# microseconds, and include time spent waiting on external commands;
+# each external command's CPU time appears under a "subprocess" root.
+
+import os
+import time
+import json
+import pstats
+import cProfile
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+active = None # the Profiler for the current run, if any
+
+class Profiler(object):
+    '''
+    Records Python and external-command timings for a single run.
+    '''
+    def __init__(self, name, output_dir):
+        self.name = name
+        self.output_dir = output_dir
+        self.subprocesses = []
+        self._profile = cProfile.Profile()
+
+    def path(self, suffix):
+        '''
+        Returns the path to one of the profile output files.
+        '''
+        return os.path.join(self.output_dir, self.name + suffix)
+
+    def start(self):
+        '''
+        Starts recording.
+        '''
+        self._profile.enable()
+
+    def stop(self):
+        '''
+        Stops recording and writes the profile output files.
+        '''
+        self._profile.disable()
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        self._profile.dump_stats(self.path(".prof"))
+        with open(self.path(".subprocess.jsonl"), "w") as f:
+            for entry in self.subprocesses:
+                f.write(json.dumps(entry, sort_keys=True) + "\n")
+        with open(self.path(".folded"), "w") as f:
+            for stack, weight in self.folded_stacks():
+                f.write(stack + " " + str(weight) + "\n")
+        logger.info("Profile written to " + self.path(".*"))
+
+    def record_subprocess(self, name, cmd, wall, usage):
+        '''
+        Records the wall time and resource usage (from `os.wait4`) of an
+        external command.
+        '''
+        self.subprocesses.append({
+            "name": name,
+            "command": cmd,
+            "wall": round(wall, 6),
+            "user": round(usage.ru_utime, 6),
+            "sys": round(usage.ru_stime, 6),
+            "maxrss_kb": usage.ru_maxrss,
+            })
+
+    def folded_stacks(self):
+        '''
+        Returns a list of (stack, microseconds) pairs in collapsed-stack
+        format. cProfile records only caller/callee pairs, so the time of
+        a function reached by several paths is split among them in
+        proportion to the time each caller spent in it.
+        '''
+        stats = pstats.Stats(self._profile).stats
+        callees = {}
+        for func, (cc, nc, tt, ct, callers) in stats.items():
+            for caller in callers:
+                callees.setdefault(caller, []).append(func)
+
+        folded = {}
+        def walk(func, stack, weight):
+            tt, ct = stats[func][2], stats[func][3]
+            stack = stack + [_frame_name(func)]
+            own = int(round(tt * weight * 1e6))
+            if own > 0:
+                key = ";".join(stack)
+                folded[key] = folded.get(key, 0) + own
+            for callee in callees.get(func, []):
+                if _frame_name(callee) in stack:
+                    continue # recursion
+                edge_ct = stats[callee][4][func][3]
+                callee_ct = stats[callee][3]
+                if callee_ct > 0:
+                    walk(callee, stack, weight * edge_ct / callee_ct)
+
+        for func in stats:
+            if not stats[func][4]:
+                walk(func, ["python"], 1.0)
+        for entry in self.subprocesses:
+            key = "subprocess;" + entry["name"].replace(";", "_")
+            cpu = int(round((entry["user"] + entry["sys"]) * 1e6))
+            folded[key] = folded.get(key, 0) + cpu
+        return sorted(folded.items())
+
+def _frame_name(func):
+    '''
+    Returns a flame graph frame name for a pstats function key.
+    '''
+    fname, line, name = func
+    if fname == "~":
+        return name.replace(";", "_")
+    return "{0} ({1}:{2})".format(name, os.path.basename(fname), line)
+
+def record_subprocess(name, cmd, wall, usage):
+    '''
+    Records an external command with the active profiler, if any.
+    '''
+    if active is not None:
+        active.record_subprocess(name, cmd, wall, usage)
+
+@contextmanager
+def profiled(name, output_dir):
+    '''
+    Profiles the enclosed code, writing the output files for `name` to
+    `output_dir`. If `output_dir` is None, nothing is recorded.
+    '''
+    global active
+    if output_dir is None:
+        yield None
+        return
+    name += time.strftime("-%Y%m%dT%H%M%S-") + str(os.getpid())
+    active = Profiler(name, output_dir)
+    active.start()
+    try:
+        yield active
+    finally:
+        active.stop()
+        active = None
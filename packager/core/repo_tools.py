@@ -1,17 +1,29 @@
 import os
+import json
 import shutil
 import urllib
 import zipfile
+import hashlib
 import tempfile
+from packager.core.cache import default_max_age
+from packager.core.log import get_logger, Progress
+from packager.core.errors import ModuleNotFound, SourceError
 
-def download(repo, dest="."):
+logger = get_logger(__name__)
+
+def download(repo, dest=".", local_file=None, rev="master"):
     '''
-    Downloads a zip archive of the given repository to the specified 
-    (default is current) directory.
+    Downloads a zip archive of the given repository, at the branch, tag or
+    commit `rev`, to the specified (default is current) directory, or to
+    the file `local_file`, if given.
     '''
-    url = "https://github.com/{0}/archive/master.zip".format(repo)
-    local_file = os.path.join(dest, os.path.basename(repo) + ".zip")
-    urllib.urlretrieve(url, local_file)
+    url = "https://github.com/{0}/archive/{1}.zip".format(repo, rev)
+    if local_file is None:
+        local_file = os.path.join(dest, os.path.basename(repo) + ".zip")
+    logger.info("Downloading " + url)
+    progress = Progress("Downloaded " + repo, log=logger)
+    urllib.urlretrieve(url, local_file, progress.hook)
+    progress.finish()
     return local_file
 
 def unpack(fname, dest="."):
@@ -35,23 +47,295 @@ def read(fname):
     items.pop()  # last items from list
     return items
 
-def get_module(module_name, dest="."):
+def unpack_module(fname, module_name, dest):
     '''
-    Downloads a set of repositories and attempts to locate the directory
-    containing the setup files for the given module. If found, the directory
-    path is returned.
+    Extracts only the setup files for the given module from a zip archive
+    of a repo into the directory `dest`. Returns True if the module was
+    found in the archive.
+    '''
+    z = zipfile.ZipFile(fname, mode='r')
+    prefix = os.path.commonprefix(z.namelist())
+    module_prefix = prefix + module_name + "/"
+    members = [m for m in z.namelist() if m.startswith(module_prefix)]
+    if len(members) == 0:
+        return False
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(dest))
+    try:
+        z.extractall(tmp_dir, members)
+        os.rename(os.path.join(tmp_dir, prefix, module_name), dest)
+    finally:
+        shutil.rmtree(tmp_dir)
+    return True
+
+def repositories():
+    '''
+    Returns the list of repositories searched for modules.
     '''
     repo_file = os.path.join(os.path.dirname(__file__), \
                                  "..", "repositories.txt")
-    repos = read(repo_file)
-    for r in repos:
-        zip_file = download(r, dest)
-        unpack_dir = unpack(zip_file, dest)
-        module_dir = os.path.join(unpack_dir, module_name, "")
-        if os.path.isdir(module_dir):
-            return module_dir
+    return read(repo_file)
+
+def get_module(module_name, dest=".", cache=None):
+    '''
+    Downloads a set of repositories and attempts to locate the directory
+    containing the setup files for the given module. If found, the directory
+    path is returned. If a `Cache` is given, the repo archives and the
+    module directory are taken from, or stored in, the cache, and the
+    module directory is copied into `dest`. Raises ModuleNotFound if a
+    repository can't be downloaded.
+    '''
+    repos = repositories()
+    try:
+        if cache is not None:
+            return get_cached_module(module_name, repos, cache, dest)
+        for r in repos:
+            zip_file = download(r, dest)
+            unpack_dir = unpack(zip_file, dest)
+            module_dir = os.path.join(unpack_dir, module_name, "")
+            if os.path.isdir(module_dir):
+                return module_dir
+    except (EnvironmentError, zipfile.BadZipfile) as e:
+        raise ModuleNotFound("Unable to download the module repositories: " \
+                             + str(e))
+    return None
+
+def get_cached_module(module_name, repos, cache, dest):
+    '''
+    Locates the setup files for the given module in the cache, filling
+    the cache from the given repositories if needed, and copies them into
+    the directory `dest`, where a later refresh of the cache can't
+    remove them.
+    '''
+    def fill_archive(repo):
+        return lambda staged: download(repo, local_file=staged)
+
+    def fill_module(staged):
+        for r in repos:
+            zip_file = cache.get("repos", os.path.basename(r) + ".zip", \
+                                 fill_archive(r), max_age=default_max_age)
+            if unpack_module(zip_file, module_name, staged):
+                return
+
+    module_dir = cache.copy("modules", module_name, fill_module, \
+                            os.path.join(dest, module_name), \
+                            max_age=default_max_age)
+    if module_dir is not None:
+        module_dir = os.path.join(module_dir, "")
+    return module_dir
+
+# Extensions of the files in a module directory that are copied to the
+# rpmbuild SOURCES directory: patches and scripts.
+source_extensions = (".patch", ".sh", ".py")
+
+def is_source_file(fname):
+    '''
+    Returns True if a file in a module directory is copied to the
+    rpmbuild SOURCES directory.
+    '''
+    return os.path.splitext(fname)[1] in source_extensions
+
+def is_build_file(fname):
+    '''
+    Returns True if a file in a module directory is used to build the
+    module: its spec file, patches, scripts, "source.txt" and
+    "dependencies.txt".
+    '''
+    return fname in ("source.txt", "dependencies.txt") \
+        or os.path.splitext(fname)[1] == ".spec" or is_source_file(fname)
+
+def local_repository(local_dir):
+    '''
+    Returns the repository that the checkout at `local_dir` is a copy
+    of, judged by the directory's name (e.g., "rpm_models" or
+    "rpm_models-master"), or None if it isn't recognized.
+    '''
+    name = os.path.basename(os.path.normpath(os.path.expanduser(local_dir)))
+    for r in repositories():
+        base = os.path.basename(r)
+        if name == base or name.startswith(base + "-"):
+            return r
     return None
 
+def revisions(rev):
+    '''
+    Parses a revision spec: a revision for all the repositories and/or
+    comma-separated "repo@rev" items giving the revision of one
+    repository, by its full or short name, e.g.,
+    "rpm_models@1a2b3c4,rpm_tools@5d6e7f8". Returns a dict mapping
+    repository names to revisions, with the revision for all the
+    repositories, if given, under None.
+    '''
+    result = {}
+    for item in rev.split(","):
+        item = item.strip()
+        if "@" in item:
+            name, r = item.split("@", 1)
+            result[name] = r
+        elif item:
+            result[None] = item
+    return result
+
+def index(repo_dir, repo=None):
+    '''
+    Returns an index of the modules in an unpacked repo: a dict mapping
+    each module name to the SHA-1 digests of its build files, the
+    packages listed in its "dependencies.txt", and `repo`, the name of
+    the repository it came from.
+    '''
+    result = {}
+    for name in sorted(os.listdir(repo_dir)):
+        module_dir = os.path.join(repo_dir, name)
+        if name.startswith(".") or not os.path.isdir(module_dir):
+            continue
+        files = {}
+        for fname in sorted(os.listdir(module_dir)):
+            fpath = os.path.join(module_dir, fname)
+            if is_build_file(fname) and os.path.isfile(fpath):
+                with open(fpath, "rb") as f:
+                    files[fname] = hashlib.sha1(f.read()).hexdigest()
+        if len(files) == 0:
+            continue
+        deps_file = os.path.join(module_dir, "dependencies.txt")
+        requires = read(deps_file) if os.path.isfile(deps_file) else []
+        result[name] = {"files": files, "requires": requires, "repo": repo}
+    return result
+
+def get_index(rev="master", local_dir=None, repos=None):
+    '''
+    Returns an index (see `index`) of the modules in the repositories
+    (default is all of them) at the revisions given by `rev` (see
+    `revisions`), or of the modules in the checkout at `local_dir`, if
+    given. A repository without a revision is left out. Where
+    repositories hold modules with the same name, the first repository's
+    module is used, as in `get_module`. Raises SourceError if a revision
+    names an unknown repository, if no repository has a revision, or if
+    a repository can't be downloaded at its revision.
+    '''
+    if local_dir is not None:
+        local_dir = os.path.expanduser(local_dir)
+        if not os.path.isdir(local_dir):
+            raise SourceError("The directory " + local_dir \
+                              + " doesn't exist.")
+        return index(local_dir, local_repository(local_dir))
+    if repos is None:
+        repos = repositories()
+    revs = revisions(rev)
+    known = set(repos) | set(os.path.basename(r) for r in repos) | set([None])
+    unknown = sorted(name for name in revs if name not in known)
+    if len(unknown) > 0:
+        raise SourceError("Unknown repository: " + ", ".join(unknown) + ".")
+    result = {}
+    indexed = 0
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for r in repos:
+            r_rev = revs.get(r, revs.get(os.path.basename(r), revs.get(None)))
+            if r_rev is None:
+                logger.warning("No revision given for " + r + ".")
+                continue
+            try:
+                zip_file = download(r, tmp_dir, rev=r_rev)
+                unpack_dir = unpack(zip_file, os.path.join(tmp_dir, \
+                                                           os.path.basename(r)))
+            except zipfile.BadZipfile:
+                raise SourceError("No revision '" + r_rev + "' in " + r + ".")
+            except EnvironmentError as e:
+                raise SourceError("Unable to download " + r + " at '" \
+                                  + r_rev + "': " + str(e))
+            for name, entry in index(unpack_dir, r).items():
+                result.setdefault(name, entry)
+            indexed += 1
+    finally:
+        shutil.rmtree(tmp_dir)
+    if indexed == 0:
+        raise SourceError("No repository has a revision in '" + rev + "'.")
+    return result
+
+def save_index(idx, fname):
+    '''
+    Writes an index to a JSON file.
+    '''
+    with open(fname, "w") as f:
+        json.dump(idx, f, indent=1, sort_keys=True)
+
+def load_index(fname):
+    '''
+    Reads an index from a JSON file. Raises SourceError if it can't be
+    read.
+    '''
+    try:
+        with open(fname, "r") as f:
+            return json.load(f)
+    except (EnvironmentError, ValueError) as e:
+        raise SourceError("Unable to read index " + fname + ": " + str(e))
+
+def common_repositories(old_index, new_index):
+    '''
+    Returns two indexes holding only the modules from the repositories
+    found in both `old_index` and `new_index`, so that the modules of a
+    repository missing from one index aren't taken as added or removed.
+    Indexes with modules from an unknown repository (e.g., saved before
+    the repository was recorded) are returned as they are.
+    '''
+    old_repos = set(e.get("repo") for e in old_index.values())
+    new_repos = set(e.get("repo") for e in new_index.values())
+    if None in old_repos or None in new_repos:
+        return old_index, new_index
+    common = old_repos & new_repos
+    for r in sorted(new_repos - common):
+        logger.warning("Leaving out " + r + ", which isn't in the old index.")
+    def only_common(idx):
+        return dict((name, entry) for name, entry in idx.items() \
+                    if entry["repo"] in common)
+    return only_common(old_index), only_common(new_index)
+
+def changed_modules(old_index, new_index):
+    '''
+    Returns the set of modules in `new_index` that were added, or whose
+    build files changed, since `old_index`.
+    '''
+    return set(name for name, entry in new_index.items() \
+               if old_index.get(name, {}).get("files") != entry["files"])
+
+def affected_modules(old_index, new_index):
+    '''
+    Returns a list of the modules that changed since `old_index`, plus
+    the modules that depend on them, directly or indirectly, ordered so
+    that each module comes after the modules it depends on. A module
+    depends on another if the other's name is listed in its
+    "dependencies.txt". Each module is given as a (name, requires) pair,
+    where `requires` lists the modules in the result that it depends on
+    directly.
+    '''
+    dependents = {}
+    for name, entry in new_index.items():
+        for package in entry["requires"]:
+            if package in new_index and package != name:
+                dependents.setdefault(package, set()).add(name)
+
+    affected = set()
+    pending = sorted(changed_modules(old_index, new_index))
+    while pending:
+        name = pending.pop()
+        if name not in affected:
+            affected.add(name)
+            pending.extend(sorted(dependents.get(name, ())))
+
+    ordered = []
+    def visit(name, visiting):
+        if name in ordered or name in visiting:
+            return # done, or a dependency cycle
+        visiting.add(name)
+        for package in sorted(new_index[name]["requires"]):
+            if package in affected:
+                visit(package, visiting)
+        ordered.append(name)
+    for name in sorted(affected):
+        visit(name, set())
+    return [(name, sorted(p for p in set(new_index[name]["requires"]) \
+                          if p in affected and p != name)) \
+            for name in ordered]
+
 def main():
     repo = "csdms/rpm_models"
     tmp_dir = tempfile.mkdtemp(prefix=main.__module__)
@@ -0,0 +1,222 @@
+#! /usr/bin/env python
+#
+# Runs external commands in the background, with timeouts, cancellation
+# and a limit on the number of commands running at once. Each command's
+# combined stdout and stderr is logged line by line, at INFO, as it's
+# produced. When a command fails and its log isn't showing INFO messages
+# (e.g., with `build_rpm --quiet`), its last lines are logged as errors,
+# so the reason for the failure is still shown.
+#
+# Usage:
+#   >>> r = Runner(max_jobs=4, timeout=600)
+#   >>> job = r.start(["rpm", "-q", "--quiet", "gcc"])
+#   >>> job.wait()
+#   0
+
+import os
+import time
+import signal
+import logging
+import threading
+import subprocess
+import collections
+from packager.core import profiling
+
+logger = logging.getLogger(__name__)
+
+kill_grace = 5.0 # seconds between SIGTERM and SIGKILL
+output_tail = 20 # lines of output logged when a command fails
+
+def report_failure(log, lines, name):
+    '''
+    Logs the last lines of a failed command's output as errors, unless
+    `log` already shows the command's output.
+    '''
+    enabled = getattr(log, "isEnabledFor", None)
+    if enabled is None or enabled(logging.INFO):
+        return
+    for line in lines:
+        log.error(line, extra={"command": name})
+
+class Job(object):
+    '''
+    An external command running in a background thread. The command is
+    started in its own process group, so a timeout or cancellation also
+    stops any processes it started (e.g., a shell running `wget`). Unless
+    `report` is False, the end of its output is reported if it fails (see
+    `report_failure`); commands whose failure is an answer, like
+    `rpm -q`, shouldn't be reported.
+    '''
+    def __init__(self, cmd, shell=False, log=None, timeout=None, \
+                 slots=None, report=True, **kwargs):
+        self.cmd = cmd
+        self.shell = shell
+        self.command = cmd if shell else " ".join(cmd)
+        self.name = (cmd.split() if shell else cmd)[0]
+        self.log = logger if log is None else log
+        self.timeout = timeout
+        self.returncode = None
+        self.timed_out = False
+        self.cancelled = False
+        self.error = None
+        self.output = collections.deque(maxlen=output_tail)
+        self.report = report
+        self._slots = slots
+        self._kwargs = kwargs
+        self._proc = None
+        self._done = False
+        self._kill_timer = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            self._execute()
+        except Exception as e:
+            self.error = e
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def _execute(self):
+        with self._lock:
+            if self.cancelled:
+                self.returncode = -signal.SIGTERM
+                return
+            self.log.debug("Running: " + self.command)
+            start = time.time()
+            self._proc = subprocess.Popen(self.cmd, shell=self.shell, \
+                                          stdout=subprocess.PIPE, \
+                                          stderr=subprocess.STDOUT, \
+                                          preexec_fn=os.setsid, \
+                                          **self._kwargs)
+        timer = None
+        if self.timeout is not None:
+            timer = threading.Timer(self.timeout, self._expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            for line in iter(self._proc.stdout.readline, b""):
+                text = line.decode("utf-8", "replace").rstrip()
+                self.output.append(text)
+                self.log.info(text, extra={"command": self.name})
+            self._proc.stdout.close()
+            pid, status, usage = os.wait4(self._proc.pid, 0)
+        finally:
+            if timer is not None:
+                timer.cancel()
+        with self._lock:
+            self._done = True
+            if self._kill_timer is not None:
+                self._kill_timer.cancel()
+            if os.WIFSIGNALED(status):
+                self._proc.returncode = -os.WTERMSIG(status)
+            else:
+                self._proc.returncode = os.WEXITSTATUS(status)
+            self.returncode = self._proc.returncode
+        profiling.record_subprocess(self.name, self.command, \
+                                    time.time() - start, usage)
+        if self.report and self.returncode != 0 and not self.cancelled:
+            report_failure(self.log, self.output, self.name)
+        if self.timed_out:
+            self.log.error("Timed out after {0} s: {1}".format(
+                self.timeout, self.command))
+
+    def _signal(self, signum):
+        with self._lock:
+            if self._proc is not None and not self._done:
+                try:
+                    os.killpg(self._proc.pid, signum)
+                except OSError:
+                    pass # already exited
+
+    def _kill(self):
+        self._signal(signal.SIGTERM)
+        with self._lock:
+            if self._done or self._kill_timer is not None:
+                return
+            self._kill_timer = threading.Timer(kill_grace, self._signal, \
+                                               [signal.SIGKILL])
+            self._kill_timer.daemon = True
+            self._kill_timer.start()
+
+    def _expire(self):
+        self.timed_out = True
+        self._kill()
+
+    def cancel(self):
+        '''
+        Stops the command, or keeps it from starting if it's waiting for
+        a free slot.
+        '''
+        self.cancelled = True
+        self._kill()
+
+    def done(self):
+        '''
+        True if the command has finished.
+        '''
+        return not self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        '''
+        Waits for the command to finish and returns its exit status, or
+        its negated signal number if it was killed. Returns None if it's
+        still running after `timeout` seconds. Re-raises any error from
+        starting the command (e.g., OSError if it can't be found).
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        while self._thread.is_alive():
+            if deadline is not None and time.time() >= deadline:
+                return None
+            self._thread.join(0.1) # short joins stay interruptible
+        if self.error is not None:
+            raise self.error
+        return self.returncode
+
+class Runner(object):
+    '''
+    Starts external commands as Jobs, running no more than `max_jobs` at
+    once (no limit if None). `timeout` is the default for each command.
+    '''
+    def __init__(self, max_jobs=None, timeout=None):
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self._slots = None if max_jobs is None \
+                      else threading.BoundedSemaphore(max_jobs)
+        self._jobs = []
+        self._lock = threading.Lock()
+
+    def start(self, cmd, shell=False, log=None, timeout=None, report=True, \
+              **kwargs):
+        '''
+        Starts a command in the background and returns its Job.
+        '''
+        timeout = self.timeout if timeout is None else timeout
+        job = Job(cmd, shell=shell, log=log, timeout=timeout, \
+                  slots=self._slots, report=report, **kwargs)
+        with self._lock:
+            self._jobs = [j for j in self._jobs if not j.done()] + [job]
+        return job
+
+    def run(self, cmd, shell=False, log=None, timeout=None, report=True, \
+            **kwargs):
+        '''
+        Runs a command and returns its exit status.
+        '''
+        return self.start(cmd, shell, log, timeout, report, **kwargs).wait()
+
+    def cancel(self):
+        '''
+        Cancels all the commands that are running or waiting to run.
+        '''
+        with self._lock:
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel()
+
+default = Runner()
@@ -0,0 +1,152 @@
+#! /usr/bin/env python
+
+from packager.core.cache import Cache
+from nose.tools import *
+from nose import with_setup
+import os, shutil
+import tempfile
+import time
+import multiprocessing
+
+# Setup fixture
+def setup_func():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+# Teardown fixture
+def teardown_func():
+    shutil.rmtree(tmp_dir)
+
+def write_file(path, text="data"):
+    with open(path, "w") as f:
+        f.write(text)
+
+def slow_fill(root, count_file):
+    def fill(staged):
+        with open(count_file, "a") as f:
+            f.write("x")
+        time.sleep(0.2)
+        write_file(staged)
+    Cache(root).get("sources", "foo.tar.gz", fill)
+
+@with_setup(setup_func, teardown_func)
+def test_get_fills_missing_entry():
+    cache = Cache(tmp_dir)
+    path = cache.get("sources", "foo.tar.gz", write_file)
+    assert_equal(path, cache.path("sources", "foo.tar.gz"))
+    assert_true(os.path.isfile(path))
+
+@with_setup(setup_func, teardown_func)
+def test_get_reuses_entry():
+    cache = Cache(tmp_dir)
+    cache.get("sources", "foo.tar.gz", write_file)
+    path = cache.get("sources", "foo.tar.gz", lambda staged: fail())
+    assert_true(os.path.isfile(path))
+
+@with_setup(setup_func, teardown_func)
+def test_get_refills_stale_entry():
+    cache = Cache(tmp_dir)
+    path = cache.get("sources", "foo.tar.gz", write_file)
+    os.utime(path, (0, 0))
+    cache.get("sources", "foo.tar.gz",
+              lambda staged: write_file(staged, "new"), max_age=60)
+    with open(path) as f:
+        assert_equal(f.read(), "new")
+
+@with_setup(setup_func, teardown_func)
+def test_get_without_fill_returns_none():
+    cache = Cache(tmp_dir)
+    assert_is_none(cache.get("modules", "foo", lambda staged: None))
+    assert_equal(cache.stats()["modules"], (0, 0))
+
+@with_setup(setup_func, teardown_func)
+def test_concurrent_get_fills_once():
+    count_file = os.path.join(tmp_dir, "count")
+    procs = [multiprocessing.Process(target=slow_fill,
+                                     args=(tmp_dir, count_file))
+             for i in range(4)]
+    for p in procs: p.start()
+    for p in procs: p.join()
+    with open(count_file) as f:
+        assert_equal(f.read(), "x")
+
+@raises(ValueError)
+@with_setup(setup_func, teardown_func)
+def test_unknown_bucket_fails():
+    Cache(tmp_dir).path("foo", "bar")
+
+@with_setup(setup_func, teardown_func)
+def test_prune_by_age():
+    cache = Cache(tmp_dir)
+    old = cache.get("sources", "old.tar.gz", write_file)
+    new = cache.get("sources", "new.tar.gz", write_file)
+    os.utime(old, (0, 0))
+    assert_equal(cache.prune(max_age=60), [old])
+    assert_true(os.path.isfile(new))
+
+@with_setup(setup_func, teardown_func)
+def test_prune_by_size():
+    cache = Cache(tmp_dir)
+    old = cache.get("sources", "old.tar.gz", write_file)
+    cache.get("sources", "new.tar.gz", write_file)
+    os.utime(old, (0, 0))
+    assert_equal(cache.prune(max_size=4), [old])
+    assert_equal(cache.stats()["sources"], (1, 4))
+
+@with_setup(setup_func, teardown_func)
+def test_held_entry_not_refreshed():
+    cache = Cache(tmp_dir)
+    path = cache.get("sources", "foo.tar.gz", write_file)
+    os.utime(path, (0, 0))
+    with cache.hold("sources", "foo.tar.gz"):
+        cache.get("sources", "foo.tar.gz",
+                  lambda staged: write_file(staged, "new"), max_age=60)
+        with open(path) as f:
+            assert_equal(f.read(), "data")
+    cache.get("sources", "foo.tar.gz",
+              lambda staged: write_file(staged, "new"), max_age=60)
+    with open(path) as f:
+        assert_equal(f.read(), "new")
+
+def hold_entry(root, ready, done):
+    cache = Cache(root)
+    with cache.hold("modules", "foo"):
+        ready.set()
+        done.wait(10)
+
+@with_setup(setup_func, teardown_func)
+def test_held_entry_not_pruned():
+    cache = Cache(tmp_dir)
+    path = cache.get("modules", "foo", os.mkdir)
+    os.utime(path, (0, 0))
+    ready, done = multiprocessing.Event(), multiprocessing.Event()
+    p = multiprocessing.Process(target=hold_entry, args=(tmp_dir, ready, done))
+    p.start()
+    try:
+        ready.wait(10)
+        assert_equal(cache.prune(max_age=60), [])
+        assert_false(cache.remove("modules", "foo"))
+        assert_true(os.path.isdir(path))
+    finally:
+        done.set()
+        p.join()
+    assert_equal(cache.prune(max_age=60), [path])
+
+@with_setup(setup_func, teardown_func)
+def test_copy_is_private():
+    cache = Cache(tmp_dir)
+    def fill(staged):
+        os.mkdir(staged)
+        write_file(os.path.join(staged, "foo.spec"))
+    dest = os.path.join(tmp_dir, "foo")
+    assert_equal(cache.copy("modules", "foo", fill, dest), dest)
+    os.utime(cache.path("modules", "foo"), (0, 0))
+    cache.get("modules", "foo", os.mkdir, max_age=60)
+    assert_true(os.path.isfile(os.path.join(dest, "foo.spec")))
+
+@with_setup(setup_func, teardown_func)
+def test_copy_links_file():
+    cache = Cache(tmp_dir)
+    dest = os.path.join(tmp_dir, "foo.tar.gz")
+    cache.copy("sources", "foo.tar.gz", write_file, dest)
+    assert_true(os.path.samefile(dest, cache.path("sources", "foo.tar.gz")))
@@ -0,0 +1,53 @@
+#! /usr/bin/env python
+
+from packager.core import log
+from packager.core import runner
+from nose.tools import *
+import re
+import json
+import logging
+from StringIO import StringIO
+
+def setup_stream(json_lines):
+    stream = StringIO()
+    log.configure("DEBUG", json_lines, stream=stream)
+    return stream
+
+def test_plain_messages():
+    stream = setup_stream(False)
+    log.get_logger("test").info("Building RPMs.")
+    assert_true(re.match(r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d "
+                         r"Building RPMs\.\n$", stream.getvalue()))
+
+def test_json_lines():
+    stream = setup_stream(True)
+    log.get_logger("test").warning("Slow.", extra={"rate": 1.5})
+    entry = json.loads(stream.getvalue())
+    assert_equal(entry["message"], "Slow.")
+    assert_equal(entry["level"], "WARNING")
+    assert_equal(entry["logger"], "packager.test")
+    assert_equal(entry["rate"], 1.5)
+    assert_true("time" in entry)
+
+def test_level():
+    stream = StringIO()
+    log.configure("WARNING", stream=stream)
+    log.get_logger("test").info("Hidden.")
+    assert_equal(stream.getvalue(), "")
+
+def test_progress():
+    stream = setup_stream(True)
+    progress = log.Progress("Downloaded", interval=0)
+    progress.hook(0, 8192, 16384)
+    progress.hook(1, 8192, 16384)
+    progress.hook(2, 8192, 16384)
+    progress.finish()
+    lines = [json.loads(l) for l in stream.getvalue().splitlines()]
+    assert_equal(lines[-1]["bytes"], 16384)
+    assert_equal(lines[-1]["total"], 16384)
+
+def test_plain_command_output_timestamped():
+    stream = setup_stream(False)
+    runner.default.run("echo foo", shell=True, log=log.logger)
+    assert_true(re.match(r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d foo$",
+                         stream.getvalue().splitlines()[-1]))
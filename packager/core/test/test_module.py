@@ -1,6 +1,7 @@
 #! /usr/bin/env python
 
 from packager.core.module import Module
+from packager.core.errors import ModuleNotFound, SourceError
 from nose.tools import *
 from nose import with_setup
 
@@ -10,3 +11,99 @@ name = "hydrotrend"
 def test_Module_noargs_fails():
     Module()
 
+import os, shutil
+import errno
+import tempfile
+import tarfile
+
+# Setup fixture
+def setup_func():
+    global tmp_dir, module_dir, sources_dir
+    tmp_dir = tempfile.mkdtemp()
+    module_dir = os.path.join(tmp_dir, name)
+    sources_dir = os.path.join(tmp_dir, "SOURCES")
+    src_dir = os.path.join(tmp_dir, "src")
+    for dname in (module_dir, sources_dir, os.path.join(src_dir, "lib")):
+        os.makedirs(dname)
+    with open(os.path.join(src_dir, "lib", "main.c"), "w") as f:
+        f.write("int main() { return 0; }\n")
+    with open(os.path.join(module_dir, "source.txt"), "w") as f:
+        f.write("cp -r " + src_dir + "\n")
+
+# Teardown fixture
+def teardown_func():
+    shutil.rmtree(tmp_dir)
+
+@with_setup(setup_func, teardown_func)
+def test_get_source_local():
+    m = Module(name, None, tmp_dir)
+    tarball = m.get_source()
+    assert_equal(tarball, os.path.join(module_dir, name + "-head.tar.gz"))
+    assert_equal(sorted(os.listdir(module_dir)),
+                 sorted(["source.txt", name + "-head.tar.gz"]))
+
+@with_setup(setup_func, teardown_func)
+def test_get_source_to_dest():
+    m = Module(name, "1.0", tmp_dir)
+    tarball = m.get_source(dest=sources_dir)
+    assert_equal(os.listdir(sources_dir), [name + "-1.0.tar.gz"])
+    assert_true(os.path.samefile(tarball,
+                                 os.path.join(module_dir, name + "-1.0.tar.gz")))
+    tar = tarfile.open(tarball)
+    assert_equal(sorted(tar.getnames()), [name + "-1.0", name + "-1.0/lib",
+                                          name + "-1.0/lib/main.c"])
+    tar.close()
+
+@with_setup(setup_func, teardown_func)
+def test_get_source_present_is_linked():
+    m = Module(name, None, tmp_dir)
+    tarball = m.get_source()
+    linked = m.get_source(dest=sources_dir)
+    assert_equal(os.path.dirname(linked), sources_dir)
+    assert_true(os.path.samefile(tarball, linked))
+
+@raises(ModuleNotFound)
+@with_setup(setup_func, teardown_func)
+def test_Module_not_found():
+    Module("child", None, tmp_dir)
+
+@raises(SourceError)
+@with_setup(setup_func, teardown_func)
+def test_get_source_fails():
+    with open(os.path.join(module_dir, "source.txt"), "w") as f:
+        f.write("false\n")
+    Module(name, None, tmp_dir).get_source()
+
+@raises(SourceError)
+@with_setup(setup_func, teardown_func)
+def test_get_source_makes_nothing():
+    with open(os.path.join(module_dir, "source.txt"), "w") as f:
+        f.write("true\n")
+    Module(name, None, tmp_dir).get_source()
+
+class FullDisk(tarfile.TarFile):
+    def add(self, name, *args, **kwargs):
+        if os.path.isfile(name):
+            raise IOError(errno.ENOSPC, "No space left on device")
+        tarfile.TarFile.add(self, name, *args, **kwargs)
+
+@with_setup(setup_func, teardown_func)
+def test_make_tarball_fails_cleanly():
+    m = Module(name, None, tmp_dir)
+    tarfile_open = tarfile.open
+    tarfile.open = FullDisk.open
+    try:
+        assert_raises(SourceError, m.get_source)
+    finally:
+        tarfile.open = tarfile_open
+    assert_equal(sorted(os.listdir(module_dir)), ["source.txt"])
+
+@with_setup(setup_func, teardown_func)
+def test_get_source_to_dest_reused():
+    Module(name, "1.0", tmp_dir).get_source(dest=sources_dir)
+    shutil.rmtree(sources_dir)
+    os.mkdir(sources_dir)
+    with open(os.path.join(module_dir, "source.txt"), "w") as f:
+        f.write("false\n")
+    tarball = Module(name, "1.0", tmp_dir).get_source(dest=sources_dir)
+    assert_equal(os.path.dirname(tarball), sources_dir)
@@ -0,0 +1,53 @@
+#! /usr/bin/env python
+
+from packager.core import profiling
+from packager.core import runner
+from nose.tools import *
+from nose import with_setup
+import os, shutil
+import glob
+import json
+import tempfile
+
+# Setup fixture
+def setup_func():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+# Teardown fixture
+def teardown_func():
+    shutil.rmtree(tmp_dir)
+
+def busy():
+    return sum(i * i for i in range(100000))
+
+def profile_run():
+    with profiling.profiled("test", tmp_dir) as p:
+        assert_true(profiling.active is p)
+        busy()
+        assert_equal(runner.default.run(["sh", "-c", "exit 2"]), 2)
+    return p
+
+@with_setup(setup_func, teardown_func)
+def test_profiled_writes_output():
+    profile_run()
+    assert_is_none(profiling.active)
+    for suffix in (".prof", ".subprocess.jsonl", ".folded"):
+        assert_equal(len(glob.glob(os.path.join(tmp_dir, "*" + suffix))), 1)
+
+@with_setup(setup_func, teardown_func)
+def test_subprocess_recorded():
+    p = profile_run()
+    with open(p.path(".subprocess.jsonl")) as f:
+        entries = [json.loads(line) for line in f]
+    assert_equal([e["name"] for e in entries], ["sh"])
+    assert_true(entries[0]["maxrss_kb"] > 0)
+    with open(p.path(".folded")) as f:
+        stacks = [line.rsplit(" ", 1)[0] for line in f]
+    assert_true("subprocess;sh" in stacks)
+    assert_true(any(s.startswith("python;") and "busy" in s for s in stacks))
+
+def test_no_output_dir():
+    with profiling.profiled("test", None) as p:
+        assert_is_none(p)
+        assert_is_none(profiling.active)
@@ -1,6 +1,7 @@
 #! /usr/bin/python
 
 import packager.core.repo_tools as repo
+from packager.core.errors import SourceError
 from nose.tools import *
 from nose import with_setup
 import os, shutil
@@ -48,3 +49,114 @@ def test_read():
 def test_get_module():
     pass
 
+
+def make_archive(dest):
+    import zipfile
+    zip_file = os.path.join(dest, "rpm_models.zip")
+    z = zipfile.ZipFile(zip_file, mode='w')
+    z.writestr("rpm_models-master/hydrotrend/hydrotrend.spec", "Name: foo")
+    z.writestr("rpm_models-master/cem/cem.spec", "Name: bar")
+    z.close()
+    return zip_file
+
+@with_setup(setup_func, teardown_func)
+def test_unpack_module():
+    zip_file = make_archive(tmp_dir)
+    module_dir = os.path.join(tmp_dir, "hydrotrend")
+    assert_true(repo.unpack_module(zip_file, "hydrotrend", module_dir))
+    assert_equal(os.listdir(module_dir), ["hydrotrend.spec"])
+
+@with_setup(setup_func, teardown_func)
+def test_unpack_module_not_found():
+    zip_file = make_archive(tmp_dir)
+    module_dir = os.path.join(tmp_dir, "child")
+    assert_false(repo.unpack_module(zip_file, "child", module_dir))
+    assert_false(os.path.exists(module_dir))
+
+def make_module(repo_dir, name, requires=(), spec="Name: foo"):
+    module_dir = os.path.join(repo_dir, name)
+    os.makedirs(module_dir)
+    with open(os.path.join(module_dir, name + ".spec"), "w") as f:
+        f.write(spec)
+    with open(os.path.join(module_dir, "README.md"), "w") as f:
+        f.write(spec)
+    with open(os.path.join(module_dir, "dependencies.txt"), "w") as f:
+        f.write("# Dependencies\n" + "".join(r + "\n" for r in requires))
+
+@with_setup(setup_func, teardown_func)
+def test_index():
+    make_module(tmp_dir, "babel")
+    make_module(tmp_dir, "cem", requires=["babel", "gcc"])
+    idx = repo.index(tmp_dir)
+    assert_equal(sorted(idx.keys()), ["babel", "cem"])
+    assert_equal(sorted(idx["cem"]["files"].keys()),
+                 ["cem.spec", "dependencies.txt"])
+    assert_equal(idx["cem"]["requires"], ["babel", "gcc"])
+    assert_equal(idx["cem"]["repo"], None)
+    assert_equal(repo.index(tmp_dir, repo_name)["cem"]["repo"], repo_name)
+
+def test_revisions():
+    assert_equal(repo.revisions("1a2b3c4"), {None: "1a2b3c4"})
+    assert_equal(repo.revisions("rpm_models@1a2b3c4, csdms/rpm_tools@v1.0"),
+                 {"rpm_models": "1a2b3c4", "csdms/rpm_tools": "v1.0"})
+
+def test_local_repository():
+    assert_equal(repo.local_repository("/home/mp/rpm_tools/"), repo_name)
+    assert_equal(repo.local_repository("rpm_tools-master"), repo_name)
+    assert_equal(repo.local_repository("/home/mp/models"), None)
+
+def fake_download(content):
+    '''
+    Returns a stand-in for `download` that writes `content` as the
+    archive, or raises it if it's an exception.
+    '''
+    def download(r, dest=".", local_file=None, rev="master"):
+        if isinstance(content, Exception):
+            raise content
+        local_file = os.path.join(dest, os.path.basename(r) + ".zip")
+        with open(local_file, "w") as f:
+            f.write(content)
+        return local_file
+    return download
+
+@with_setup(setup_func, teardown_func)
+def test_get_index_fails():
+    real_download = repo.download
+    try:
+        for content in ("Not Found", IOError("socket error")):
+            repo.download = fake_download(content)
+            assert_raises(SourceError, repo.get_index, "typo-rev")
+        assert_raises(SourceError, repo.get_index, "rpm_model@1a2b3c4")
+        assert_raises(SourceError, repo.get_index,
+                      local_dir=os.path.join(tmp_dir, "nowhere"))
+    finally:
+        repo.download = real_download
+
+def test_common_repositories():
+    def entry(r):
+        return {"files": {"x.spec": "1"}, "requires": [], "repo": r}
+    old = {"babel": entry("csdms/rpm_tools")}
+    new = {"babel": entry("csdms/rpm_tools"),
+           "cem": entry("csdms/rpm_models")}
+    assert_equal(repo.common_repositories(old, new), (old, old))
+    legacy = {"babel": {"files": {"x.spec": "1"}, "requires": []}}
+    assert_equal(repo.common_repositories(legacy, new), (legacy, new))
+
+@with_setup(setup_func, teardown_func)
+def test_save_and_load_index():
+    make_module(tmp_dir, "babel")
+    idx = repo.index(tmp_dir)
+    fname = os.path.join(tmp_dir, "index.json")
+    repo.save_index(idx, fname)
+    assert_equal(repo.load_index(fname), idx)
+
+def test_affected_modules():
+    def entry(digest, requires=()):
+        return {"files": {"x.spec": digest}, "requires": list(requires)}
+    old = {"babel": entry("1"), "cem": entry("1", ["babel"]),
+           "child": entry("1", ["cem"]), "sedflux": entry("1")}
+    new = dict(old, babel=entry("2"), hydrotrend=entry("1"))
+    assert_equal(repo.affected_modules(old, new),
+                 [("babel", []), ("cem", ["babel"]), ("child", ["cem"]),
+                  ("hydrotrend", [])])
+    assert_equal(repo.affected_modules(new, new), [])
@@ -0,0 +1,83 @@
+#! /usr/bin/env python
+
+from packager.core.runner import Runner
+from packager.core import log
+from nose.tools import *
+import json
+import time
+from StringIO import StringIO
+
+def test_run():
+    assert_equal(Runner().run(["sh", "-c", "exit 3"]), 3)
+
+def test_run_shell():
+    assert_equal(Runner().run("true && false", shell=True), 1)
+
+@raises(OSError)
+def test_run_missing_command_fails():
+    Runner().run(["no-such-command-for-packager"])
+
+def test_timeout():
+    start = time.time()
+    job = Runner(timeout=0.2).start("sleep 10; echo done", shell=True)
+    assert_true(job.wait() < 0)
+    assert_true(job.timed_out)
+    assert_true(time.time() - start < 5)
+
+def test_cancel():
+    r = Runner()
+    job = r.start(["sleep", "10"])
+    assert_is_none(job.wait(0.1))
+    r.cancel()
+    assert_true(job.wait() < 0)
+    assert_true(job.cancelled)
+
+def wait_until_running(job):
+    while job._proc is None:
+        time.sleep(0.01)
+
+def test_max_jobs():
+    r = Runner(max_jobs=1)
+    first = r.start(["sleep", "0.3"])
+    wait_until_running(first) # so it takes the slot first
+    second = r.start(["true"])
+    assert_is_none(second.wait(0.1)) # waiting for a slot
+    assert_equal(first.wait(), 0)
+    assert_equal(second.wait(), 0)
+
+def test_cancel_waiting_job():
+    r = Runner(max_jobs=1)
+    first = r.start(["sleep", "0.3"])
+    wait_until_running(first)
+    second = r.start(["true"])
+    second.cancel()
+    first.wait()
+    assert_true(second.wait() < 0)
+
+def test_failure_reported_when_quiet():
+    stream = StringIO()
+    log.configure("WARNING", stream=stream)
+    Runner().run("echo done; echo reason >&2; exit 1", shell=True,
+                 log=log.logger)
+    Runner().run("echo answer; exit 1", shell=True, log=log.logger,
+                 report=False)
+    Runner().run("echo fine", shell=True, log=log.logger)
+    log.configure()
+    lines = stream.getvalue().splitlines()
+    assert_equal([l.split(" ", 2)[2] for l in lines], ["done", "reason"])
+
+def test_output_logged():
+    stream = StringIO()
+    log.configure("DEBUG", True, stream=stream)
+    ret = Runner().run("echo foo; echo bar >&2; exit 3", shell=True,
+                       log=log.logger)
+    assert_equal(ret, 3)
+    lines = [json.loads(l) for l in stream.getvalue().splitlines()]
+    assert_equal([l["message"] for l in lines if "command" in l],
+                 ["foo", "bar"])
+
+def test_kill_timer_cancelled():
+    job = Runner(timeout=0.2).start("sleep 10", shell=True)
+    job.wait()
+    job._kill_timer.join(1.0) # cancelled timers exit promptly
+    assert_false(job._kill_timer.is_alive())
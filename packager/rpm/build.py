@@ -14,51 +14,198 @@
 #   $ build_rpm cem --tag 0.2 --quiet
 #   $ build_rpm hydrotrend --local $HOME/rpm_models
 #   $ build_rpm babel --prefix /usr/local/csdms
+#   $ build_rpm cem --cache $HOME/.cache/packagebuilder
+#   $ build_rpm cem --profile $HOME/profiles
+#   $ build_rpm cem --timeout 3600
+#   $ build_rpm cem --executor http://buildhost:8642
+#   $ sudo build_rpm cem --buildroot
+#   $ build_rpm cem --publish /srv/repos/csdms
+#   $ build_rpm cem --manifest /srv/repos/csdms/manifest.db
+#   $ build_rpm --changed-since 1a2b3c4 --save-index $HOME/models.json
+#   $ build_rpm --changed-since $HOME/models.json
+#   $ build_rpm --changed-since rpm_models@1a2b3c4 --local $HOME/rpm_models
 #
 # Mark Piper (mark.piper@colorado.edu)
 
-import sys, os, shutil
-from subprocess import call
+import os, shutil
 import glob
 import shlex
+import time
+from contextlib import contextmanager
 from packager.core.module import Module
+from packager.core import repo_tools as repo
 from packager.core.flavor import debian_check
+from packager.core.cache import Cache
+from packager.core import log
+from packager.rpm import executor as executors
+from packager.rpm.buildroot import Buildroot, ChrootExecutor, \
+    parse_dependencies
+from packager.rpm.preflight import preflight
+from packager.rpm.verify import verify
+from packager.rpm.publish import Repository
+from packager.rpm.manifest import Manifest
+from packager.core.errors import PackagerError, BuildError
+
+logger = log.get_logger(__name__)
+
+class BuildResult(object):
+    '''
+    The outcome of building a module: the RPMs produced, their headers
+    (see `packager.rpm.header`), a list of (step, seconds) pairs giving
+    the time taken by each step, and the error that stopped the build, if
+    any.
+    '''
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+        self.artifacts = []
+        self.packages = []
+        self.timings = []
+        self.error = None
+
+    @property
+    def ok(self):
+        '''
+        True if the build succeeded.
+        '''
+        return self.error is None
+
+    @contextmanager
+    def timed(self, step):
+        '''
+        Records the wall time of the enclosed step.
+        '''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings.append((step, time.time() - start))
 
 class BuildRPM(object):
     '''
     Uses `rpmbuild` to build a CSDMS model or tool into an RPM.
+
+    The constructor only records the build settings; call `run` to do the
+    build. Each instance builds in its own `topdir` (default is
+    `~/rpmbuild`), so builds that run at the same time, in threads or in
+    separate processes, must be given different `topdir`s. If given,
+    `timeout` limits the time, in seconds, allowed for downloading the
+    source and for running `rpmbuild`. `executor` runs `rpmbuild`, here
+    or on a worker node (see `packager.rpm.executor`). With `buildroot`,
+    `rpmbuild` runs in a clean chroot with only the module's dependencies
+    installed (see `packager.rpm.buildroot`). The RPMs are checked after
+    the build (see `packager.rpm.verify`). If `publish_dir` is given,
+    they're published to a yum repository there, and if `manifest` is
+    given, they're added to the manifest database at that path (see
+    `packager.rpm.manifest`).
     '''
-    def __init__(self, name, version, local_dir, prefix, quiet):
-        self.is_debian = debian_check()
+    def __init__(self, name, version=None, local_dir=None, prefix=None, \
+                 quiet=False, cache_dir=None, topdir=None, timeout=None, \
+                 executor=None, buildroot=False, publish_dir=None, \
+                 manifest=None):
+        self.name = name
+        self.version = version
+        self.local_dir = local_dir
         self.is_quiet = " --quiet " if quiet else " "
         self.install_prefix = "/usr/local" if prefix is None else prefix
+        self.cache = None if cache_dir is None else Cache(cache_dir)
+        if topdir is None:
+            topdir = os.path.join(os.path.expanduser("~"), "rpmbuild")
+        self.rpmbuild = os.path.join(topdir, "")
+        self.timeout = timeout
+        self.executor = executors.LocalExecutor() if executor is None \
+                        else executor
+        self.use_buildroot = buildroot
+        self.publish_dir = publish_dir
+        self.manifest = manifest
+        self.module = None
 
-        # Get the model or tool and its spec file.
-        self.module = Module(name, version, local_dir)
+    def plan(self):
+        '''
+        Locates the module and its spec file. Raises ModuleNotFound if the
+        module can't be located.
+        '''
+        self.is_debian = debian_check()
+        self.module = Module(self.name, self.version, self.local_dir, \
+                             cache=self.cache, timeout=self.timeout)
         self.spec_file = os.path.join(self.module.location, \
                                           self.module.name + ".spec")
+        if self.use_buildroot:
+            cache = Cache() if self.cache is None else self.cache
+            repos = [] if self.publish_dir is None else [self.publish_dir]
+            self.executor = ChrootExecutor(Buildroot(cache, repos=repos), \
+                parse_dependencies(self.module.dependencies))
+
+    def run(self, raise_errors=True):
+        '''
+        Builds the binary and source RPMs for the module and returns a
+        BuildResult. If the build fails, the PackagerError is raised, or,
+        if `raise_errors` is False, stored in the result.
+        '''
+        result = BuildResult(self.name, self.version)
+        try:
+            # Get the model or tool and its spec file.
+            if self.module is None:
+                with result.timed("plan"):
+                    self.plan()
+            result.version = self.module.version
 
-        # Set up the local rpmbuild directory.
-        self.rpmbuild = os.path.join(os.getenv("HOME"), "rpmbuild", "")
-        self.prep_directory()
+            # Check the module files before doing any heavy work.
+            with result.timed("preflight"):
+                self.preflight()
 
-        # Download the module's source code and make a tarball.
-        self.tarball = self.module.get_source()
+            # Set up the local rpmbuild directory.
+            with result.timed("prep_directory"):
+                self.prep_directory()
 
-        # Copy module files to the rpmbuild directory.
-        self.prep_files()
+            # Download the module's source code and make a tarball in the
+            # rpmbuild SOURCES directory.
+            with result.timed("get_source"):
+                self.tarball = self.module.get_source(dest=self.sources_dir)
 
-        # Build the binary and source RPMs.
-        self.build()
-        self.cleanup()
-        print("Success!")
+            # Copy module files to the rpmbuild directory.
+            with result.timed("prep_files"):
+                self.prep_files()
+
+            # Build the binary and source RPMs.
+            with result.timed("build"):
+                self.build()
+            result.artifacts = self.artifacts()
+
+            # Check the RPMs against the install prefix.
+            with result.timed("verify"):
+                result.packages = verify(result.artifacts, \
+                                         self.install_prefix)
+
+            # Publish the RPMs to a local repository.
+            if self.publish_dir is not None:
+                with result.timed("publish"):
+                    result.artifacts = Repository(self.publish_dir) \
+                        .publish(result.artifacts)
+
+            # Record the RPMs in the manifest.
+            if self.manifest is not None:
+                with result.timed("manifest"):
+                    manifest = Manifest(self.manifest)
+                    try:
+                        manifest.add(result.packages, result.artifacts)
+                    finally:
+                        manifest.close()
+            logger.info("Success!")
+        except PackagerError as e:
+            result.error = e
+            if raise_errors:
+                raise
+        finally:
+            self.cleanup()
+        return result
 
     def prep_directory(self):
         '''
-        Prepares the RPM build directory `~/rpmbuild`. Sets up member
-        variables for paths in the build directory.
+        Prepares the RPM build directory (default is `~/rpmbuild`). Sets up
+        member variables for paths in the build directory.
         '''
-        print("Setting up rpmbuild directory structure.")
+        logger.info("Setting up rpmbuild directory structure.")
         if os.path.isdir(self.rpmbuild):
             shutil.rmtree(self.rpmbuild)
         subdirectories = ["BUILD","BUILDROOT","RPMS","SOURCES","SPECS","SRPMS"]
@@ -69,75 +216,116 @@ class BuildRPM(object):
 
     def prep_files(self):
         '''
-        Copies source tarball, spec file, patches (if any) and scripts
-        (if any) for the build process.  Patches must use the extension 
-        ".patch", scripts must use the extension ".sh" or ".py".
+        Copies spec file, patches (if any) and scripts (if any) for the
+        build process; the source tarball is already in place. Patches
+        must use the extension ".patch", scripts must use the extension
+        ".sh" or ".py" (see `repo_tools.is_source_file`).
         '''
-        print("Copying module files.")
+        logger.info("Copying module files.")
         shutil.copy(self.spec_file, self.specs_dir)
-        shutil.copy(self.tarball, self.sources_dir)
-        for patch in glob.glob(os.path.join(self.module.location, "*.patch")):
-            shutil.copy(patch, self.sources_dir)
-        for script in glob.glob(os.path.join(self.module.location, "*.sh")):
-            shutil.copy(script, self.sources_dir)
-        for script in glob.glob(os.path.join(self.module.location, "*.py")):
-            shutil.copy(script, self.sources_dir)
+        for fname in sorted(os.listdir(self.module.location)):
+            fpath = os.path.join(self.module.location, fname)
+            if repo.is_source_file(fname) and os.path.isfile(fpath):
+                shutil.copy(fpath, self.sources_dir)
 
-    def build(self):
+    def defines(self):
         '''
-        Builds binary and source RPMS for the module.
+        Returns a dict of the macros defined for `rpmbuild`.
         '''
-        print("Building RPMs.")
-        cmd = "rpmbuild -ba" + self.is_quiet \
-            + os.path.join(self.specs_dir, os.path.basename(self.spec_file)) \
-            + " --define '_prefix " + self.install_prefix + "'" \
-            + " --define '_version " + self.module.version + "'"
+        macros = {"_prefix": self.install_prefix,
+                  "_version": self.module.version}
         if not self.is_debian:
-            cmd += " --define '_buildrequires " + self.module.dependencies + "'"
-        print(cmd)
-        ret = call(shlex.split(cmd))
+            macros["_buildrequires"] = self.module.dependencies
+        return macros
+
+    def preflight(self):
+        '''
+        Checks the spec file, the files it uses, and, when building on
+        this host, that its BuildRequires are installed. On Debian, where
+        `rpmbuild` isn't given the module's dependencies, BuildRequires
+        aren't checked. Raises
+        PreflightError listing any problems.
+        '''
+        on_host = isinstance(self.executor, executors.LocalExecutor) \
+                  and not self.is_debian
+        preflight(self.spec_file, self.module.location, self.defines(), \
+                  self.module.tarball_name(), cache=self.cache, \
+                  check_dependencies=on_host, \
+                  check_requires=not self.is_debian)
+
+    def build(self):
+        '''
+        Builds binary and source RPMS for the module. Raises BuildError if
+        `rpmbuild` fails.
+        '''
+        logger.info("Building RPMs.")
+        cmd = "-ba" + self.is_quiet \
+            + os.path.join("SPECS", os.path.basename(self.spec_file))
+        for name, value in sorted(self.defines().items()):
+            cmd += " --define '" + name + " " + value + "'"
+        ret = self.executor.build(self.rpmbuild.rstrip("/"), \
+                                  shlex.split(cmd), logger, self.timeout)
         if ret != 0:
-            print("Error in building module RPM.")
-            sys.exit(2) # can't build RPM
+            raise BuildError("Error in building module RPM.")
+
+    def artifacts(self):
+        '''
+        Returns a list of the binary and source RPMs that were built.
+        '''
+        return sorted(glob.glob(os.path.join(self.rpmbuild, "RPMS", "*", \
+                                             "*.rpm"))) \
+            + sorted(glob.glob(os.path.join(self.rpmbuild, "SRPMS", "*.rpm")))
 
     def cleanup(self):
         '''
         Deletes the directory used to store the downloaded archives from
         the rpm_models and rpm_tools repos.
         '''
-        self.module.cleanup()
+        if self.module is not None:
+            self.module.cleanup()
+            self.module = None
+
+def changed_since(rev, local_dir=None, index_file=None):
+    '''
+    Returns the modules to rebuild, in build order, after the changes to
+    the module repositories since `rev`, which is either an index file
+    saved with `index_file` or revisions of the repositories (see
+    `repo_tools.revisions`). A `rev` ending in ".json", or holding a "/"
+    but no "@", is taken as an index file, which must exist. The current
+    modules are taken from GitHub
+    or from the repo checkout at `local_dir`. Only the repositories in
+    both the old and the current index are compared. If given, the
+    current index is saved to `index_file`, once the old index is read. Each module is given as a
+    (name, requires) pair; see `repo_tools.affected_modules`.
+    '''
+    new_index = repo.get_index(local_dir=local_dir)
+    if os.path.isfile(rev) or rev.endswith(".json") \
+            or ("/" in rev and "@" not in rev):
+        old_index = repo.load_index(rev)
+    else:
+        repos = None
+        if local_dir is not None:
+            local_repo = repo.local_repository(local_dir)
+            if local_repo is None:
+                logger.warning("Can't tell which repository " + local_dir \
+                               + " is a checkout of.")
+            else:
+                repos = [local_repo]
+        old_index = repo.get_index(rev=rev, repos=repos)
+    if index_file is not None:
+        repo.save_index(new_index, index_file)
+    old_index, new_index = repo.common_repositories(old_index, new_index)
+    return repo.affected_modules(old_index, new_index)
 
 #-----------------------------------------------------------------------------
 
 def main():
     '''
-    Accepts command-line arguments and passes them to an instance of BuildRPM.
+    Accepts command-line arguments and passes them to an instance of BuildRPM
+    (see `packager.cli.build_rpm`).
     '''
-    import argparse
-    from packager import __version__
-
-    # Allow only Linuxen.
-    if not sys.platform.startswith('linux'):
-        print("Error: this OS is not supported.")
-        sys.exit(1) # not Linux
-
-    parser = argparse.ArgumentParser(
-        description="Builds a CSDMS model or tool into an RPM.")
-    parser.add_argument("module_name",
-                        help="the name of the model or tool to build")
-    parser.add_argument("--local",
-                        help="use LOCAL path to the module files")
-    parser.add_argument("--prefix",
-                        help="use PREFIX as install path for RPM [/usr/local]")
-    parser.add_argument("--tag",
-                        help="build TAG version of the module [head]")
-    parser.add_argument("--quiet", action="store_true",
-                        help="provide less detailed output [verbose]")
-    parser.add_argument('--version', action='version', 
-                        version='build_rpm ' + __version__)
-    args = parser.parse_args()
-
-    BuildRPM(args.module_name, args.tag, args.local, args.prefix, args.quiet)
+    from packager.cli import build_rpm
+    build_rpm()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,308 @@
+#! /usr/bin/env python
+#
+# Clean, reusable buildroots for building RPMs in a chroot. A buildroot
+# image is made by installing a base set of packages plus a module's
+# dependencies into an empty directory with `yum --installroot`. An
+# empty root has no release package for yum (or dnf) to take $releasever
+# from, so the installer is given `--releasever=/`, which uses the
+# host's release; pass a different `installer` to Buildroot to build for
+# another release. Images are kept in the cache's "buildroots" bucket, keyed by a digest of the
+# package set, so modules with the same dependencies share one image.
+# Dependencies may also be installed from local repositories of
+# packages built earlier (see `publish`). An image with dependencies
+# published there is also keyed by the published RPMs of those
+# packages, so it's remade when one of them is republished; images whose
+# dependencies all come from the distro are kept.
+# Each build gets a copy-on-write clone of the image: an overlay mount
+# when possible, otherwise a reflink copy (a full copy on filesystems
+# without reflinks). /proc, /sys and /dev are mounted in each clone, as
+# on the host, and unmounted before the clone is deleted.
+#
+# Building in a chroot needs root privileges.
+
+import os
+import shutil
+import pipes
+import hashlib
+import tempfile
+from packager.core.log import get_logger
+from packager.core import runner
+from packager.core.errors import BuildError
+
+logger = get_logger(__name__)
+
+base_packages = ("bash", "coreutils", "findutils", "gzip", "tar", "gcc",
+                 "gcc-c++", "make", "rpm-build")
+
+default_installer = ("yum", "-y", "--installroot={root}", "--releasever=/",
+                     "install")
+
+# Filesystems mounted in a buildroot clone: directory and `mount` args.
+special_mounts = (("proc", ["-t", "proc", "proc"]),
+                  ("sys", ["-t", "sysfs", "sysfs"]),
+                  ("dev", ["--bind", "/dev"]))
+
+def parse_dependencies(dependencies):
+    '''
+    Returns a sorted list of package names from a Module's comma-separated
+    dependency string.
+    '''
+    return sorted(set(d.strip() for d in dependencies.split(",") \
+                      if d.strip()))
+
+def dependency_key(packages):
+    '''
+    Returns the cache key for a buildroot holding the given packages.
+    '''
+    digest = hashlib.sha1("\n".join(sorted(set(packages)))).hexdigest()
+    return "root-" + digest[:16]
+
+class Buildroot(object):
+    '''
+    Makes and clones buildroot images held in a Cache. `installer` is the
+    command that installs packages into a root directory; "{root}" in
+    any of its arguments is replaced with the directory. `mode` is
+    "overlay", "copy", or None to use an overlay when running as root.
+    If `mounts` is True, /proc, /sys and /dev are mounted in each clone;
+    by default, they are when running as root. `repos` lists local yum
+    repositories that dependencies are also installed from.
+    '''
+    def __init__(self, cache, installer=default_installer, \
+                 packages=base_packages, mode=None, workdir=None, \
+                 mounts=None, repos=()):
+        self.cache = cache
+        self.installer = list(installer)
+        self.packages = list(packages)
+        self.mode = mode
+        self.workdir = workdir
+        self.mounts = os.geteuid() == 0 if mounts is None else mounts
+        self.repos = [os.path.abspath(os.path.expanduser(r)) for r in repos]
+
+    def _published_repos(self):
+        '''
+        Returns the repositories in `repos` that have metadata.
+        '''
+        return [r for r in self.repos \
+                if os.path.isfile(os.path.join(r, "repodata", "repomd.xml"))]
+
+    def repo_options(self):
+        '''
+        Returns the installer options that add the local repositories.
+        '''
+        options = []
+        for i, path in enumerate(self._published_repos()):
+            name = "packagebuilder" + str(i)
+            options += ["--repofrompath=" + name + ",file://" + path,
+                        "--setopt=" + name + ".gpgcheck=0"]
+        return options
+
+    def published(self):
+        '''
+        Returns a dict mapping the names of the binary packages in the
+        local repositories to the paths of their RPM files.
+        '''
+        result = {}
+        for path in self._published_repos():
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = [d for d in dirnames \
+                               if d not in ("repodata", "src")]
+                for fname in sorted(filenames):
+                    if fname.endswith(".rpm") \
+                            and not fname.endswith(".src.rpm"):
+                        name = fname[:-len(".rpm")].rsplit("-", 2)[0]
+                        result.setdefault(name, []).append( \
+                            os.path.join(dirpath, fname))
+        return result
+
+    def repo_state(self, packages):
+        '''
+        Returns a list of strings identifying the published RPMs, if
+        any, of the given packages.
+        '''
+        published = self.published()
+        state = []
+        for name in packages:
+            for path in published.get(name, []):
+                st = os.stat(path)
+                state.append("rpm:{0}:{1}:{2}".format(path, st.st_size, \
+                                                      st.st_mtime))
+        return state
+
+    def install(self, root, packages, log, timeout=None, options=()):
+        '''
+        Installs packages into the root directory `root`, passing the
+        installer any extra `options`.
+        '''
+        cmd = [a.replace("{root}", root) for a in self.installer] \
+              + list(options) + packages
+        ret = runner.default.run(cmd, log=log, timeout=timeout)
+        if ret != 0:
+            raise BuildError("Unable to install packages into buildroot.")
+
+    def image(self, dependencies, log, timeout=None):
+        '''
+        Returns the path to a buildroot image holding the base packages
+        and the given dependencies, making it if it isn't cached. The
+        base image is made once and cloned for each dependency set. The
+        caller should hold the image (see `Cache.hold`) while using it.
+        '''
+        def base():
+            return self.cache.get("buildroots", self.key([]), \
+                lambda staged: self._make_base(staged, log, timeout))
+
+        packages = sorted(set(dependencies) - set(self.packages))
+        if len(packages) == 0:
+            return base()
+
+        def fill(staged):
+            with self.cache.hold("buildroots", self.key([])):
+                image = base()
+                log.info("Making buildroot for: " + ", ".join(packages))
+                self.copy(image, staged, log, timeout)
+            self.install(staged, packages, log, timeout, self.repo_options())
+
+        return self.cache.get("buildroots", self.key(packages), fill)
+
+    def _make_base(self, staged, log, timeout):
+        log.info("Making base buildroot.")
+        os.mkdir(staged)
+        self.install(staged, self.packages, log, timeout)
+
+    def key(self, dependencies):
+        '''
+        Returns the cache key of the image for the given dependencies.
+        '''
+        packages = sorted(set(dependencies) - set(self.packages))
+        if len(packages) == 0:
+            return dependency_key(self.packages)
+        return dependency_key(self.packages + packages \
+                              + self.repo_state(packages))
+
+    def copy(self, src, dest, log=logger, timeout=None):
+        '''
+        Copies a directory tree, sharing file data if the filesystem
+        supports reflinks.
+        '''
+        ret = runner.default.run(["cp", "-a", "--reflink=auto", src, dest], \
+                                 log=log, timeout=timeout)
+        if ret != 0:
+            raise BuildError("Unable to copy buildroot " + src + ".")
+
+    def checkout(self, image, log=logger, timeout=None):
+        '''
+        Makes a copy-on-write clone of a buildroot image for one build,
+        and returns the path to its root directory.
+        '''
+        root = self._clone(image, log, timeout)
+        if self.mounts:
+            for dname, args in special_mounts:
+                target = os.path.join(root, dname)
+                if not os.path.isdir(target):
+                    os.makedirs(target)
+                if runner.default.run(["mount"] + args + [target], \
+                                      log=log) != 0:
+                    self.release(root, log)
+                    raise BuildError("Unable to mount /" + dname \
+                                     + " in buildroot.")
+        return root
+
+    def _clone(self, image, log, timeout):
+        '''
+        Clones a buildroot image into a new temporary directory.
+        '''
+        tmp = tempfile.mkdtemp(prefix="packager-root-", dir=self.workdir)
+        root = os.path.join(tmp, "root")
+        mode = self.mode
+        if mode is None:
+            mode = "overlay" if os.geteuid() == 0 else "copy"
+        if mode == "overlay":
+            for dname in ("root", "upper", "work"):
+                os.mkdir(os.path.join(tmp, dname))
+            options = "lowerdir={0},upperdir={1},workdir={2}".format(
+                image, os.path.join(tmp, "upper"), os.path.join(tmp, "work"))
+            if runner.default.run(["mount", "-t", "overlay", "overlay", \
+                                   "-o", options, root], log=log, \
+                                  report=False) == 0:
+                return root
+            log.info("Unable to mount an overlay; copying the buildroot.")
+            for dname in ("root", "upper", "work"):
+                os.rmdir(os.path.join(tmp, dname))
+        self.copy(image, root, log, timeout)
+        return root
+
+    def release(self, root, log=logger):
+        '''
+        Unmounts and deletes a buildroot clone made by `checkout`. Raises
+        BuildError, leaving the clone in place, if it can't be unmounted.
+        '''
+        mounts = [os.path.join(root, dname) for dname, args \
+                  in reversed(special_mounts)] + [root]
+        for target in mounts:
+            if os.path.ismount(target):
+                runner.default.run(["umount", target], log=log)
+        still_mounted = [m for m in mounts if os.path.ismount(m)]
+        if len(still_mounted) > 0:
+            raise BuildError("Unable to unmount " + ", ".join(still_mounted) \
+                             + "; buildroot left in place.")
+        shutil.rmtree(os.path.dirname(root), ignore_errors=True)
+
+class ChrootExecutor(object):
+    '''
+    Runs `rpmbuild` in a clean chroot cloned from a buildroot image with
+    the module's dependencies installed. See `executor` for the interface.
+    '''
+    def __init__(self, buildroot, dependencies, command=("rpmbuild",)):
+        self.buildroot = buildroot
+        self.dependencies = list(dependencies)
+        self.command = list(command)
+
+    def build(self, topdir, args, log, timeout=None):
+        '''
+        Runs `rpmbuild` with the given arguments in a buildroot clone, and
+        copies the RPMs it makes into `topdir`. Returns the exit status of
+        `rpmbuild`, or raises BuildError if the buildroot can't be made or
+        the build times out.
+        '''
+        try:
+            with self.buildroot.cache.hold("buildroots", \
+                    self.buildroot.key(self.dependencies)):
+                image = self.buildroot.image(self.dependencies, log, timeout)
+                return self._build(image, topdir, args, log, timeout)
+        except EnvironmentError as e:
+            raise BuildError("Unable to build in buildroot: " + str(e))
+
+    def _build(self, image, topdir, args, log, timeout):
+        '''
+        Builds in a clone of `image`, which the caller holds.
+        '''
+        root = self.buildroot.checkout(image, log, timeout)
+        try:
+            rpmbuild = os.path.join(root, "rpmbuild")
+            for dname in ("SOURCES", "SPECS"):
+                shutil.copytree(os.path.join(topdir, dname), \
+                                os.path.join(rpmbuild, dname))
+            for dname in ("BUILD", "BUILDROOT", "RPMS", "SRPMS"):
+                os.mkdir(os.path.join(rpmbuild, dname))
+
+            cmd = self.command + args + ["--define", "_topdir /rpmbuild"]
+            inner = "cd /rpmbuild && exec " \
+                    + " ".join(pipes.quote(a) for a in cmd)
+            log.info("chroot " + root + " " + inner)
+            job = runner.default.start(["chroot", root, "sh", "-c", inner], \
+                                       log=log, timeout=timeout)
+            ret = job.wait()
+            if job.timed_out:
+                raise BuildError("Timed out building module RPM.")
+
+            for dname in ("RPMS", "SRPMS"):
+                for dirpath, dirnames, filenames in \
+                        os.walk(os.path.join(rpmbuild, dname)):
+                    dest = os.path.join(topdir, \
+                                        os.path.relpath(dirpath, rpmbuild))
+                    if not os.path.isdir(dest):
+                        os.makedirs(dest)
+                    for fname in filenames:
+                        shutil.copy2(os.path.join(dirpath, fname), dest)
+            return ret
+        finally:
+            self.buildroot.release(root, log)
@@ -0,0 +1,269 @@
+#! /usr/bin/env python
+#
+# Executors run `rpmbuild` for BuildRPM, either on this host or on a
+# worker node. A remote executor ships the staged SOURCES and SPECS
+# directories to the worker, runs `rpmbuild` there, streams back its
+# output, and unpacks the RPMS and SRPMS directories it produces into
+# the local rpmbuild directory.
+#
+# Executors are named with a URL:
+#   local                 run `rpmbuild` on this host (the default)
+#   ssh://[user@]host     run over SSH (needs key-based login)
+#   http://host:port      run on a `packager worker` (see `worker`)
+
+import os
+import json
+import uuid
+import pipes
+import socket
+import urllib2
+import tarfile
+import tempfile
+import urlparse
+import collections
+from packager.core import runner
+from packager.core.errors import BuildError
+
+def pack(topdir, subdirectories, fileobj):
+    '''
+    Writes a gzipped tarball of the given subdirectories of `topdir` to
+    an open file.
+    '''
+    tar = tarfile.open(fileobj=fileobj, mode="w:gz")
+    try:
+        for dname in subdirectories:
+            tar.add(os.path.join(topdir, dname), dname)
+    finally:
+        tar.close()
+
+def _inside(path, topdir):
+    '''
+    True if `path`, with any symbolic links resolved, is in `topdir`.
+    '''
+    path = os.path.realpath(path)
+    return path == topdir or path.startswith(os.path.join(topdir, ""))
+
+def unpack(fileobj, topdir):
+    '''
+    Extracts a gzipped tarball from an open file into `topdir`, refusing
+    members with absolute paths or paths that leave `topdir`, including
+    through links, and links that point out of `topdir`.
+    '''
+    topdir = os.path.realpath(topdir)
+    tar = tarfile.open(fileobj=fileobj, mode="r|gz")
+    try:
+        for member in tar:
+            path = os.path.join(topdir, member.name)
+            if os.path.isabs(member.name) or not _inside(path, topdir):
+                raise BuildError("Unsafe path in archive: " + member.name)
+            if member.issym():
+                target = os.path.join(os.path.dirname(path), member.linkname)
+            elif member.islnk():
+                target = os.path.join(topdir, member.linkname)
+            else:
+                target = path
+            if not _inside(target, topdir):
+                raise BuildError("Unsafe link in archive: " + member.name \
+                                 + " -> " + member.linkname)
+            tar.extract(member, topdir)
+    finally:
+        tar.close()
+
+class LocalExecutor(object):
+    '''
+    Runs `rpmbuild` on this host.
+    '''
+    def __init__(self, command=("rpmbuild",)):
+        self.command = list(command)
+
+    def build(self, topdir, args, log, timeout=None):
+        '''
+        Runs `rpmbuild` with the given arguments in `topdir`. Returns its
+        exit status, or raises BuildError if it times out.
+        '''
+        cmd = self.command + args + ["--define", "_topdir " + topdir]
+        log.info(" ".join(pipes.quote(a) for a in cmd))
+        job = runner.default.start(cmd, log=log, timeout=timeout, cwd=topdir)
+        try:
+            ret = job.wait()
+        except OSError as e:
+            raise BuildError("Unable to run " + self.command[0] + ": " \
+                             + str(e))
+        if job.timed_out:
+            raise BuildError("Timed out building module RPM.")
+        return ret
+
+class SSHExecutor(object):
+    '''
+    Runs `rpmbuild` on another host over SSH, in a temporary directory
+    under `remote_dir`. A build timeout is enforced on the remote host,
+    with `timeout`, so that `rpmbuild` doesn't outlive the build; the
+    local `ssh` is given `ssh_grace` more seconds before it's stopped.
+    '''
+    ssh_grace = 30.0 # seconds
+
+    def __init__(self, host, remote_dir="/tmp", ssh=("ssh", "-o", \
+                 "BatchMode=yes"), command=("rpmbuild",)):
+        self.host = host
+        self.remote_dir = remote_dir
+        self.ssh = list(ssh)
+        self.command = list(command)
+
+    def _ssh(self, remote_cmd):
+        return " ".join(pipes.quote(a) for a in \
+                        self.ssh + [self.host, remote_cmd])
+
+    def build(self, topdir, args, log, timeout=None):
+        '''
+        Copies SOURCES and SPECS to the remote host, runs `rpmbuild` with
+        the given arguments there, and copies back RPMS and SRPMS. Returns
+        the exit status of `rpmbuild`, or raises BuildError if the remote
+        host can't be reached or the build times out.
+        '''
+        remote = self.remote_dir + "/packager-" + uuid.uuid4().hex
+        log.info("Building on " + self.host + ":" + remote)
+        try:
+            return self._build(topdir, args, log, timeout, remote)
+        except OSError as e:
+            raise BuildError("Unable to run ssh: " + str(e))
+
+    def _build(self, topdir, args, log, timeout, remote):
+        '''
+        Builds in the directory `remote` on the remote host.
+        '''
+        q = pipes.quote(remote)
+        try:
+            ret = runner.default.run(
+                "tar -C " + pipes.quote(topdir) + " -czf - SOURCES SPECS | " \
+                + self._ssh("mkdir -p " + q + " && tar -C " + q + " -xzf -"), \
+                shell=True, log=log, timeout=timeout)
+            if ret != 0:
+                raise BuildError("Unable to copy files to " + self.host + ".")
+
+            cmd = self.command + args + ["--define", "_topdir " + remote]
+            if timeout is not None:
+                cmd = ["timeout", "-k", str(runner.kill_grace), \
+                       str(timeout)] + cmd
+            remote_cmd = "cd " + q + " && " \
+                         + " ".join(pipes.quote(a) for a in cmd)
+            log.info(remote_cmd)
+            job = runner.default.start(self.ssh + [self.host, remote_cmd], \
+                log=log, timeout=None if timeout is None \
+                                  else timeout + self.ssh_grace)
+            ret = job.wait()
+            if job.timed_out or (timeout is not None and ret == 124):
+                raise BuildError("Timed out building module RPM.")
+
+            fetched = runner.default.run(
+                self._ssh("tar -C " + q + " -czf - RPMS SRPMS") \
+                + " | tar -C " + pipes.quote(topdir) + " -xzf -", \
+                shell=True, log=log, timeout=timeout)
+            if fetched != 0:
+                raise BuildError("Unable to copy RPMs from " \
+                                 + self.host + ".")
+            return ret
+        finally:
+            runner.default.run(self._ssh("rm -rf " + q), shell=True, log=log)
+
+class HTTPExecutor(object):
+    '''
+    Runs `rpmbuild` on a `packager worker`. The SOURCES and SPECS
+    directories are POSTed as a tarball to `/build`, with the `rpmbuild`
+    arguments and timeout in the X-Rpmbuild-Args and X-Timeout headers.
+    The worker responds with lines of `rpmbuild` output, each prefixed
+    with "LOG ", then a line "EXIT <status> <timed out> <size>", then a
+    tarball, of `<size>` bytes, holding the RPMS and SRPMS directories.
+    With a build timeout, the connection is dropped if the worker sends
+    nothing for `worker_grace` seconds longer than the timeout.
+    '''
+    worker_grace = 30.0 # seconds
+
+    def __init__(self, url):
+        self.url = url.rstrip("/") + "/build"
+
+    def build(self, topdir, args, log, timeout=None):
+        '''
+        Sends SOURCES and SPECS to the worker, streams back the `rpmbuild`
+        output, and unpacks the RPMs into `topdir`. Returns the exit
+        status of `rpmbuild`, or raises BuildError if the worker can't be
+        reached or the build times out.
+        '''
+        log.info("Building on " + self.url)
+        try:
+            return self._build(topdir, args, log, timeout)
+        except socket.timeout:
+            raise BuildError("Timed out waiting for worker " + self.url + ".")
+        except EnvironmentError as e:
+            raise BuildError("Lost connection to worker " + self.url \
+                             + ": " + str(e))
+
+    def _build(self, topdir, args, log, timeout):
+        '''
+        Sends the build to the worker and reads back the results.
+        '''
+        with tempfile.TemporaryFile() as upload:
+            pack(topdir, ["SOURCES", "SPECS"], upload)
+            upload.seek(0, os.SEEK_END)
+            size = upload.tell()
+            upload.seek(0)
+            request = urllib2.Request(self.url, data=upload, headers={
+                "Content-Type": "application/x-gzip",
+                "Content-Length": str(size),
+                "X-Rpmbuild-Args": json.dumps(args),
+                "X-Timeout": "" if timeout is None else str(timeout),
+                })
+            try:
+                if timeout is None:
+                    response = urllib2.urlopen(request)
+                else:
+                    response = urllib2.urlopen(request, \
+                        timeout=timeout + self.worker_grace)
+            except socket.timeout:
+                raise
+            except (urllib2.URLError, IOError) as e:
+                raise BuildError("Unable to reach worker " + self.url \
+                                 + ": " + str(e))
+        output = collections.deque(maxlen=runner.output_tail)
+        try:
+            for line in iter(response.readline, ""):
+                if line.startswith("LOG "):
+                    output.append(line[4:].rstrip("\n"))
+                    log.info(output[-1], extra={"command": "rpmbuild"})
+                elif line.startswith("EXIT "):
+                    status, timed_out, nbytes = line.split()[1:]
+                    break
+            else:
+                raise BuildError("Lost connection to worker " + self.url)
+            if timed_out == "1":
+                raise BuildError("Timed out building module RPM.")
+            with tempfile.TemporaryFile() as download:
+                remaining = int(nbytes)
+                while remaining > 0:
+                    chunk = response.read(min(remaining, 65536))
+                    if not chunk:
+                        raise BuildError("Lost connection to worker " \
+                                         + self.url)
+                    download.write(chunk)
+                    remaining -= len(chunk)
+                download.seek(0)
+                unpack(download, topdir)
+        finally:
+            response.close()
+        if int(status) != 0:
+            runner.report_failure(log, output, "rpmbuild")
+        return int(status)
+
+def from_url(url):
+    '''
+    Returns the executor named by a URL (see the top of this file).
+    '''
+    if url is None or url == "local":
+        return LocalExecutor()
+    parts = urlparse.urlparse(url)
+    if parts.scheme == "ssh":
+        host = parts.netloc
+        remote_dir = parts.path if parts.path else "/tmp"
+        return SSHExecutor(host, remote_dir=remote_dir)
+    if parts.scheme in ("http", "https"):
+        return HTTPExecutor(url)
+    raise ValueError("Unknown executor: " + url)
@@ -0,0 +1,325 @@
+#! /usr/bin/env python
+#
+# Reads RPM package headers in-process, without running `rpm`. An RPM
+# file is a 96-byte lead, a signature header (padded to a multiple of 8
+# bytes), the main header and the compressed payload. Only the lead and
+# the two headers are read, so reading a package costs a few small reads
+# whatever its size. The signature header holds digests of the main
+# header and, with the main header, of the payload; `check_digests`
+# recomputes them.
+#
+# See http://ftp.rpm.org/max-rpm/s1-rpm-file-format-rpm-file-format.html
+# for the file format.
+
+import os
+import struct
+import hashlib
+from packager.core.errors import ArtifactError
+
+lead_magic = "\xed\xab\xee\xdb"
+header_magic = "\x8e\xad\xe8\x01"
+lead_size = 96
+
+# Data types.
+NULL, CHAR, INT8, INT16, INT32, INT64, STRING, BIN, STRING_ARRAY, \
+    I18NSTRING = range(10)
+
+# Main header tags.
+NAME = 1000
+VERSION = 1001
+RELEASE = 1002
+EPOCH = 1003
+SUMMARY = 1004
+SIZE = 1009
+LICENSE = 1014
+ARCH = 1022
+OLDFILENAMES = 1027
+FILESIZES = 1028
+FILEMODES = 1030
+FILEDIGESTS = 1035
+FILEFLAGS = 1037
+SOURCERPM = 1044
+PROVIDEFLAGS = 1112
+PROVIDENAME = 1047
+PROVIDEVERSION = 1113
+REQUIREFLAGS = 1048
+REQUIRENAME = 1049
+REQUIREVERSION = 1050
+DIRINDEXES = 1116
+BASENAMES = 1117
+DIRNAMES = 1118
+FILEDIGESTALGO = 5011
+LONGFILESIZES = 5008
+PAYLOADDIGEST = 5092
+PAYLOADDIGESTALGO = 5093
+
+# Signature header tags.
+SIG_SIZE = 1000
+SIG_MD5 = 1004
+SIG_SHA1 = 269
+SIG_SHA256 = 273
+
+# Digest algorithms, by their OpenPGP numbers.
+digest_algorithms = {1: "md5", 2: "sha1", 8: "sha256", 9: "sha384",
+                     10: "sha512", 11: "sha224"}
+
+_int_formats = {CHAR: "B", INT8: "B", INT16: "H", INT32: "I", INT64: "Q"}
+
+def _value(kind, store, offset, count):
+    '''
+    Decodes the value of a header entry from the header's data store.
+    Integers and string arrays are returned as lists.
+    '''
+    if kind == STRING:
+        return store[offset:store.index("\0", offset)]
+    if kind in (STRING_ARRAY, I18NSTRING):
+        values = []
+        for i in range(count):
+            end = store.index("\0", offset)
+            values.append(store[offset:end])
+            offset = end + 1
+        return values
+    if kind == BIN:
+        return store[offset:offset + count]
+    if kind in _int_formats:
+        return list(struct.unpack_from(">" + str(count) + _int_formats[kind],
+                                       store, offset))
+    return None
+
+def _read_header(f, fname):
+    '''
+    Reads a header structure from an open RPM file. Returns a dict of its
+    tags and the header's bytes, as digested by `rpm`.
+    '''
+    intro = f.read(16)
+    if len(intro) != 16 or intro[:4] != header_magic:
+        raise ArtifactError([fname + " has a bad header."])
+    nindex, hsize = struct.unpack(">II", intro[8:])
+    index = f.read(16 * nindex)
+    store = f.read(hsize)
+    if len(index) != 16 * nindex or len(store) != hsize:
+        raise ArtifactError([fname + " is truncated."])
+    tags = {}
+    try:
+        for i in range(nindex):
+            tag, kind, offset, count = struct.unpack_from(">IIII", index,
+                                                          16 * i)
+            tags[tag] = _value(kind, store, offset, count)
+    except (ValueError, struct.error):
+        raise ArtifactError([fname + " has a corrupt header."])
+    return tags, intro + index + store
+
+def _sense(flags):
+    '''
+    Returns the comparison operator in a dependency's flags, e.g., ">=".
+    '''
+    op = ""
+    if flags & 2:
+        op += "<"
+    if flags & 4:
+        op += ">"
+    if flags & 8:
+        op += "="
+    return op
+
+class RPMHeader(object):
+    '''
+    The signature and main headers of an RPM file. `tags` and
+    `signature` map tag numbers to values.
+    '''
+    def __init__(self, path, tags, signature, header_bytes, payload_offset):
+        self.path = path
+        self.tags = tags
+        self.signature = signature
+        self.header_bytes = header_bytes
+        self.payload_offset = payload_offset
+
+    def _first(self, tag, default=None):
+        '''
+        Returns the first value of a main header tag.
+        '''
+        value = self.tags.get(tag)
+        if isinstance(value, list):
+            return value[0] if len(value) > 0 else default
+        return default if value is None else value
+
+    @property
+    def name(self):
+        '''
+        The package name.
+        '''
+        return self._first(NAME)
+
+    @property
+    def version(self):
+        '''
+        The package version.
+        '''
+        return self._first(VERSION)
+
+    @property
+    def release(self):
+        '''
+        The package release.
+        '''
+        return self._first(RELEASE)
+
+    @property
+    def epoch(self):
+        '''
+        The package epoch, or None.
+        '''
+        return self._first(EPOCH)
+
+    @property
+    def summary(self):
+        '''
+        The one-line package summary.
+        '''
+        return self._first(SUMMARY, "")
+
+    @property
+    def is_source(self):
+        '''
+        True for a source RPM, which doesn't name a source RPM.
+        '''
+        return SOURCERPM not in self.tags
+
+    @property
+    def arch(self):
+        '''
+        The package architecture, or "src" for a source RPM.
+        '''
+        return "src" if self.is_source else self._first(ARCH)
+
+    @property
+    def nevra(self):
+        '''
+        The package's name-[epoch:]version-release.arch.
+        '''
+        epoch = "" if self.epoch is None else str(self.epoch) + ":"
+        return "{0}-{1}{2}-{3}.{4}".format(self.name, epoch, self.version,
+                                           self.release, self.arch)
+
+    @property
+    def digest_algorithm(self):
+        '''
+        The name of the algorithm used for file digests.
+        '''
+        return digest_algorithms.get(self._first(FILEDIGESTALGO, 1))
+
+    @property
+    def header_digest(self):
+        '''
+        The SHA-256 (or, for older packages, SHA-1) digest of the main
+        header recorded in the signature header, or None.
+        '''
+        return self.signature.get(SIG_SHA256) or self.signature.get(SIG_SHA1)
+
+    @property
+    def payload_digest(self):
+        '''
+        The digest of the compressed payload, or None.
+        '''
+        return self._first(PAYLOADDIGEST)
+
+    @property
+    def payload_digest_algorithm(self):
+        '''
+        The name of the algorithm used for the payload digest.
+        '''
+        return digest_algorithms.get(self._first(PAYLOADDIGESTALGO, 8))
+
+    def files(self):
+        '''
+        Returns a list of (path, size, mode, digest, flags) tuples for the
+        files in the package.
+        '''
+        if BASENAMES in self.tags:
+            dirnames = self.tags[DIRNAMES]
+            paths = [dirnames[i] + base for i, base in \
+                     zip(self.tags[DIRINDEXES], self.tags[BASENAMES])]
+        else:
+            paths = self.tags.get(OLDFILENAMES, [])
+        n = len(paths)
+        sizes = self.tags.get(LONGFILESIZES) or self.tags.get(FILESIZES) \
+                or [0] * n
+        modes = self.tags.get(FILEMODES) or [0] * n
+        digests = self.tags.get(FILEDIGESTS) or [""] * n
+        flags = self.tags.get(FILEFLAGS) or [0] * n
+        return zip(paths, sizes, modes, digests, flags)
+
+    def _dependencies(self, names, flags, versions):
+        names = self.tags.get(names, [])
+        n = len(names)
+        return zip(names, [_sense(f) for f in self.tags.get(flags, [0] * n)],
+                   self.tags.get(versions, [""] * n))
+
+    def provides(self):
+        '''
+        Returns a list of (name, operator, version) tuples for the
+        capabilities the package provides.
+        '''
+        return self._dependencies(PROVIDENAME, PROVIDEFLAGS, PROVIDEVERSION)
+
+    def requires(self):
+        '''
+        Returns a list of (name, operator, version) tuples for the
+        capabilities the package requires.
+        '''
+        return self._dependencies(REQUIRENAME, REQUIREFLAGS, REQUIREVERSION)
+
+def read(path):
+    '''
+    Reads the headers of an RPM file. Raises ArtifactError if the file
+    isn't an RPM.
+    '''
+    fname = os.path.basename(path)
+    with open(path, "rb") as f:
+        lead = f.read(lead_size)
+        if len(lead) != lead_size or lead[:4] != lead_magic:
+            raise ArtifactError([fname + " is not an RPM file."])
+        signature, sig_bytes = _read_header(f, fname)
+        f.read((8 - len(sig_bytes) % 8) % 8)
+        tags, header_bytes = _read_header(f, fname)
+        return RPMHeader(path, tags, signature, header_bytes, f.tell())
+
+def _file_digest(path, offset, algorithm, prefix=""):
+    '''
+    Returns the hex digest of an RPM file from `offset` to the end,
+    preceded by `prefix`.
+    '''
+    h = hashlib.new(algorithm, prefix)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for chunk in iter(lambda: f.read(1 << 20), ""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def check_digests(header, check_payload=True):
+    '''
+    Returns a list of the problems found checking the digests in a
+    package's signature header against its main header and, if
+    `check_payload` is True, its payload.
+    '''
+    fname = os.path.basename(header.path)
+    problems = []
+    for tag, algorithm in ((SIG_SHA256, "sha256"), (SIG_SHA1, "sha1")):
+        if tag in header.signature:
+            if hashlib.new(algorithm, header.header_bytes).hexdigest() \
+                    != header.signature[tag]:
+                problems.append(fname + " has a bad header digest.")
+            break
+    if not check_payload:
+        return problems
+    if PAYLOADDIGEST in header.tags:
+        if _file_digest(header.path, header.payload_offset, \
+                        header.payload_digest_algorithm) \
+                != header.payload_digest:
+            problems.append(fname + " has a bad payload digest.")
+    elif SIG_MD5 in header.signature:
+        if _file_digest(header.path, header.payload_offset, "md5", \
+                        header.header_bytes) \
+                != header.signature[SIG_MD5].encode("hex"):
+            problems.append(fname + " has a bad payload digest.")
+    return problems
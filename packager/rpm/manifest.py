@@ -0,0 +1,208 @@
+#! /usr/bin/env python
+#
+# An indexed manifest of built RPMs, kept in an SQLite database. Each
+# package's name, version, provides, requires, file list and digests are
+# taken from its headers (see `header`), so a package is added without
+# running `rpm` or reading its payload. The database can be queried with
+# the methods here, with `packager manifest query`, or with `sqlite3`:
+#
+#   $ sqlite3 manifest.db "SELECT p.name FROM packages p JOIN files f
+#       ON f.package = p.id WHERE f.path = '/usr/local/bin/hydrotrend'"
+#
+# Builds that share a manifest take turns writing to it. Strings are
+# stored as UTF-8 text; header bytes that aren't UTF-8 are replaced.
+
+import os
+import time
+import sqlite3
+from packager.core.cache import file_lock
+from packager.rpm import header as rpm_header
+
+schema = """
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY,
+    nevra TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    epoch INTEGER,
+    version TEXT NOT NULL,
+    release TEXT NOT NULL,
+    arch TEXT NOT NULL,
+    summary TEXT,
+    path TEXT,
+    size INTEGER,
+    header_digest TEXT,
+    payload_digest TEXT,
+    digest_algorithm TEXT,
+    added REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    package INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    mode INTEGER,
+    digest TEXT
+);
+CREATE TABLE IF NOT EXISTS provides (
+    package INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    op TEXT,
+    version TEXT
+);
+CREATE TABLE IF NOT EXISTS requires (
+    package INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    op TEXT,
+    version TEXT
+);
+CREATE INDEX IF NOT EXISTS packages_name ON packages (name);
+CREATE INDEX IF NOT EXISTS files_package ON files (package);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+CREATE INDEX IF NOT EXISTS provides_package ON provides (package);
+CREATE INDEX IF NOT EXISTS provides_name ON provides (name);
+CREATE INDEX IF NOT EXISTS requires_package ON requires (package);
+CREATE INDEX IF NOT EXISTS requires_name ON requires (name);
+"""
+
+def text(value):
+    '''
+    Returns a string from a header or the command line as unicode, since
+    SQLite rejects byte strings that aren't ASCII.
+    '''
+    if isinstance(value, str):
+        return value.decode("utf-8", "replace")
+    return value
+
+class Manifest(object):
+    '''
+    A manifest of RPMs in the SQLite database at `path`, which is created
+    if it doesn't exist.
+    '''
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        parent = os.path.dirname(self.path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(schema)
+
+    def close(self):
+        '''
+        Closes the database.
+        '''
+        self.db.close()
+
+    def add(self, headers, paths=None):
+        '''
+        Adds packages to the manifest, given their headers, replacing any
+        entries for the same packages. If given, `paths` lists where the
+        packages are kept (e.g., where they were published); otherwise,
+        the paths they were read from are recorded.
+        '''
+        if paths is None:
+            paths = [h.path for h in headers]
+        with file_lock(self.path + ".lock"):
+            with self.db:
+                for h, path in zip(headers, paths):
+                    self._remove(text(h.nevra))
+                    cursor = self.db.execute(
+                        "INSERT INTO packages (nevra, name, epoch, version, "
+                        "release, arch, summary, path, size, header_digest, "
+                        "payload_digest, digest_algorithm, added) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (text(h.nevra), text(h.name), h.epoch,
+                         text(h.version), text(h.release), text(h.arch),
+                         text(h.summary), text(os.path.abspath(path)),
+                         os.path.getsize(h.path), text(h.header_digest),
+                         text(h.payload_digest), h.digest_algorithm,
+                         time.time()))
+                    package = cursor.lastrowid
+                    self.db.executemany(
+                        "INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+                        [(package, text(f[0]), f[1], f[2], text(f[3])) \
+                         for f in h.files()])
+                    for table, deps in (("provides", h.provides()),
+                                        ("requires", h.requires())):
+                        self.db.executemany(
+                            "INSERT INTO " + table + " VALUES (?, ?, ?, ?)",
+                            [(package,) + tuple(text(v) for v in d) \
+                             for d in deps])
+
+    def add_files(self, rpms):
+        '''
+        Reads the headers of RPM files and adds the packages to the
+        manifest. Returns the headers.
+        '''
+        headers = [rpm_header.read(path) for path in rpms]
+        self.add(headers)
+        return headers
+
+    def _remove(self, nevra):
+        '''
+        Removes a package's entries; call inside a transaction.
+        '''
+        for row in self.db.execute("SELECT id FROM packages WHERE nevra = ?",
+                                   (text(nevra),)).fetchall():
+            for table in ("files", "provides", "requires"):
+                self.db.execute("DELETE FROM " + table + " WHERE package = ?",
+                                row)
+            self.db.execute("DELETE FROM packages WHERE id = ?", row)
+
+    def remove(self, nevra):
+        '''
+        Removes a package from the manifest.
+        '''
+        with file_lock(self.path + ".lock"):
+            with self.db:
+                self._remove(nevra)
+
+    def packages(self, name=None):
+        '''
+        Returns a list of (nevra, path) tuples for the packages in the
+        manifest, or for the packages with the given name.
+        '''
+        query = "SELECT nevra, path FROM packages"
+        args = ()
+        if name is not None:
+            query += " WHERE name = ?"
+            args = (text(name),)
+        return self.db.execute(query + " ORDER BY nevra", args).fetchall()
+
+    def files(self, nevra):
+        '''
+        Returns a list of (path, size, mode, digest) tuples for the files
+        in a package.
+        '''
+        return self.db.execute(
+            "SELECT f.path, f.size, f.mode, f.digest FROM files f "
+            "JOIN packages p ON f.package = p.id WHERE p.nevra = ? "
+            "ORDER BY f.path", (text(nevra),)).fetchall()
+
+    def owners(self, path):
+        '''
+        Returns a list of the packages that contain a file.
+        '''
+        return [row[0] for row in self.db.execute(
+            "SELECT p.nevra FROM packages p JOIN files f "
+            "ON f.package = p.id WHERE f.path = ? ORDER BY p.nevra",
+            (text(path),))]
+
+    def _dependents(self, table, name):
+        '''
+        Returns a list of the packages with a capability in `table`.
+        '''
+        return [row[0] for row in self.db.execute(
+            "SELECT DISTINCT p.nevra FROM packages p JOIN " + table + " d "
+            "ON d.package = p.id WHERE d.name = ? ORDER BY p.nevra",
+            (text(name),))]
+
+    def whatprovides(self, name):
+        '''
+        Returns a list of the packages that provide a capability.
+        '''
+        return self._dependents("provides", name)
+
+    def whatrequires(self, name):
+        '''
+        Returns a list of the packages that require a capability.
+        '''
+        return self._dependents("requires", name)
@@ -0,0 +1,267 @@
+#! /usr/bin/env python
+#
+# Checks a module's build inputs before any heavy work is done. The spec
+# file is parsed in-process, with the macros that `build_rpm` defines,
+# to check that it names the source tarball `build_rpm` will make, that
+# every other Source and Patch file is in the module directory and is
+# one that `build_rpm` copies to SOURCES, and that no BuildRequires is
+# left unset. Then the BuildRequires are checked against the installed
+# packages with a single `rpm -q --whatprovides`.
+#
+# The spec checks depend only on the module's build files and on which
+# other files are in the module directory, so their results can be kept
+# in a Cache, keyed by a digest of those.
+#
+# The parser is deliberately simple: it knows %define, %global and
+# %{?macro}, and reads only the preamble, up to the first section (e.g.,
+# %description or %prep). It doesn't evaluate %if blocks, so problems
+# with the tags inside them, including BuildRequires that aren't
+# installed, are logged as warnings rather than failing the check.
+
+import os
+import re
+import json
+import hashlib
+from packager.core import log
+from packager.core import runner
+from packager.core import repo_tools as repo
+from packager.core.errors import PreflightError
+
+logger = log.get_logger(__name__)
+
+_tag = re.compile(r"^(Name|Version|Release|Source\d*|Patch\d*|" \
+                  r"BuildRequires)\s*:\s*(.*?)\s*$", re.IGNORECASE)
+_define = re.compile(r"^%(?:define|global)\s+(\w+)\s+(.*?)\s*$")
+_if = re.compile(r"^%if(n?arch|n?os)?(\s|$)")
+_endif = re.compile(r"^%endif(\s|$)")
+_section = re.compile(r"^%(description|package|prep|build|install|check|"
+                      r"clean|files|changelog|pre|post|preun|postun|"
+                      r"pretrans|posttrans|verifyscript|trigger\w*)(\s|$)")
+_macro = re.compile(r"%\{(\??)(\w+)\}|%(\w+)")
+
+def expand(text, macros):
+    '''
+    Expands the macros in a line of a spec file. Unknown macros are left
+    in place, except for "%{?macro}", which expands to nothing.
+    '''
+    def replace(match):
+        optional, name = match.group(1), match.group(2) or match.group(3)
+        if name in macros:
+            return macros[name]
+        return "" if optional else match.group(0)
+    for i in range(10): # allow nested macros
+        expanded = _macro.sub(replace, text)
+        if expanded == text:
+            break
+        text = expanded
+    return text
+
+def parse_spec(text, macros=None, conditional=False):
+    '''
+    Returns a dict of the tags in a spec file's preamble, with macros
+    expanded. The values of repeated tags (e.g., BuildRequires) are
+    collected in lists; keys are lowercase. Only the tags outside %if
+    blocks are returned, or, if `conditional` is True, only those inside
+    them.
+    '''
+    macros = dict(macros or {})
+    tags = {}
+    depth = 0
+    for line in text.splitlines():
+        if _section.match(line):
+            break
+        if _if.match(line):
+            depth += 1
+            continue
+        if _endif.match(line):
+            depth = max(depth - 1, 0)
+            continue
+        match = _define.match(line)
+        if match:
+            macros[match.group(1)] = expand(match.group(2), macros)
+            continue
+        match = _tag.match(line)
+        if match and (depth > 0) == conditional:
+            key = match.group(1).lower()
+            value = expand(match.group(2), macros)
+            if key in ("name", "version", "release"):
+                macros[key] = value
+                tags[key] = value
+            else:
+                tags.setdefault(key, []).append(value)
+    return tags
+
+def requirement_names(build_requires):
+    '''
+    Returns the package names from a list of BuildRequires values, which
+    may hold several comma- or space-separated requirements with version
+    constraints.
+    '''
+    names = []
+    for value in build_requires:
+        tokens = value.replace(",", " ").split()
+        skip = False
+        for token in tokens:
+            if skip:
+                skip = False
+            elif token in ("<", "<=", "=", ">=", ">"):
+                skip = True # skip the version that follows
+            else:
+                names.append(token)
+    return names
+
+def _sources(tags):
+    return [os.path.basename(v) for k in sorted(tags) \
+            if k.startswith("source") or k.startswith("patch") \
+            for v in tags[k]]
+
+def _tag_problems(tags, module_dir, tarball_name, check_requires):
+    '''
+    Returns a list of the problems found with the Source, Patch and
+    BuildRequires tags of a spec file.
+    '''
+    problems = []
+    for fname in _sources(tags):
+        if fname == tarball_name:
+            continue
+        if not os.path.isfile(os.path.join(module_dir, fname)):
+            problems.append("The file " + fname + " is missing from " \
+                            + module_dir + ".")
+        elif not repo.is_source_file(fname):
+            problems.append("The file " + fname + " isn't copied for the " \
+                            "build; use one of the extensions " \
+                            + ", ".join(repo.source_extensions) + ".")
+    if check_requires:
+        for value in tags.get("buildrequires", []):
+            if "%" in value or not value:
+                problems.append("BuildRequires is unset: '" + value + "'.")
+    return problems
+
+def check_spec(spec_file, module_dir, macros, tarball_name, \
+               check_requires=True, warnings=None):
+    '''
+    Returns a list of the problems found in a spec file, given the macros
+    that `rpmbuild` will be run with. If `check_requires` is False,
+    BuildRequires aren't checked. Problems with the tags inside %if
+    blocks, which may not apply, are appended to `warnings`, if given.
+    '''
+    if not os.path.isfile(spec_file):
+        return ["The spec file " + os.path.basename(spec_file) \
+                + " is missing."]
+    with open(spec_file, "r") as f:
+        text = f.read()
+    tags = parse_spec(text, macros)
+    optional = parse_spec(text, macros, conditional=True)
+
+    problems = []
+    for key in ("name", "version"):
+        if not tags.get(key) or "%" in tags[key]:
+            problems.append("The spec file has no valid " \
+                            + key.capitalize() + ".")
+    sources = _sources(tags) + _sources(optional)
+    if tarball_name not in sources:
+        problems.append("The spec file has no Source for " + tarball_name \
+                        + " (found: " + (", ".join(sources) or "none") + ").")
+    problems += _tag_problems(tags, module_dir, tarball_name, check_requires)
+    if warnings is not None:
+        warnings += _tag_problems(optional, module_dir, tarball_name, \
+                                  check_requires)
+    return problems
+
+def build_requires(spec_file, macros, conditional=False):
+    '''
+    Returns the package names in a spec file's BuildRequires, outside
+    %if blocks or, if `conditional` is True, inside them.
+    '''
+    with open(spec_file, "r") as f:
+        tags = parse_spec(f.read(), macros, conditional)
+    return requirement_names(tags.get("buildrequires", []))
+
+def check_installed(packages):
+    '''
+    Returns the list of the given packages (or files) that aren't provided
+    by any installed package, checking them all with one `rpm` command.
+    If `rpm` isn't installed, nothing is checked.
+    '''
+    if len(packages) == 0:
+        return []
+    missing = []
+    try:
+        ret = runner.default.run(["rpm", "-q", "--whatprovides"] + packages, \
+                                 log=_MissingLog(missing))
+    except OSError:
+        logger.warning("Unable to run rpm; BuildRequires not checked.")
+        return []
+    return missing if ret != 0 else []
+
+class _MissingLog(object):
+    '''
+    Collects the packages that `rpm -q --whatprovides` reports missing.
+    '''
+    def __init__(self, missing):
+        self.missing = missing
+
+    def info(self, msg, *args, **kwargs):
+        if msg.startswith("no package provides "):
+            self.missing.append(msg[len("no package provides "):].strip())
+        logger.debug(msg)
+
+    debug = warning = error = info
+
+def digest(module_dir, macros, tarball_name, check_requires=True):
+    '''
+    Returns a digest of a module's build files, the names of the other
+    files in its directory, the macros it's built with, its tarball name
+    and `check_requires`, for caching preflight results.
+    '''
+    h = hashlib.sha1(json.dumps([macros, tarball_name, check_requires, 2], \
+                                sort_keys=True))
+    for fname in sorted(os.listdir(module_dir)):
+        fpath = os.path.join(module_dir, fname)
+        if os.path.isfile(fpath):
+            h.update(fname + "\0")
+            if repo.is_build_file(fname):
+                with open(fpath, "rb") as f:
+                    h.update(f.read())
+    return h.hexdigest()
+
+def preflight(spec_file, module_dir, macros, tarball_name, cache=None, \
+              check_dependencies=True, check_requires=True):
+    '''
+    Checks a module's build inputs, raising PreflightError with all the
+    problems found. With a `cache`, spec check results are reused for
+    unchanged module files. If `check_requires` is False, BuildRequires
+    aren't checked at all; if `check_dependencies` is True, they must be
+    installed on this host.
+    '''
+    def results():
+        warnings = []
+        problems = check_spec(spec_file, module_dir, macros, tarball_name, \
+                              check_requires, warnings)
+        return {"problems": problems, "warnings": warnings}
+
+    if cache is None:
+        checked = results()
+    else:
+        def fill(staged):
+            with open(staged, "w") as f:
+                json.dump(results(), f)
+        key = digest(module_dir, macros, tarball_name, check_requires) \
+              + ".json"
+        with open(cache.get("preflight", key, fill), "r") as f:
+            checked = json.load(f)
+    problems, warnings = checked["problems"], checked["warnings"]
+    if len(problems) == 0 and check_requires and check_dependencies:
+        missing = check_installed(build_requires(spec_file, macros))
+        if len(missing) > 0:
+            problems.append("Required packages aren't installed: " \
+                            + ", ".join(missing) + ".")
+        missing = check_installed(build_requires(spec_file, macros, True))
+        if len(missing) > 0:
+            warnings.append("Conditional BuildRequires aren't installed: " \
+                            + ", ".join(missing) + ".")
+    for warning in warnings:
+        logger.warning(warning)
+    if len(problems) > 0:
+        raise PreflightError(problems)
+    logger.info("Preflight checks passed.")
@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+#
+# Publishes built RPMs to a local yum repository. RPMs are filed by
+# architecture (source RPMs under "src"), and the repodata is updated
+# with `createrepo_c --update --skip-stat`, which reuses the existing
+# metadata for packages already in the repository and reads headers
+# only from new ones, so publishing stays fast as the repository grows.
+#
+# Builds in a buildroot (`build_rpm --buildroot --publish`) install
+# their BuildRequires from the repository directly. For builds on the
+# host, a "packagebuilder.repo" file is written to the repository, for
+# copying to /etc/yum.repos.d.
+
+import os
+import shutil
+import filecmp
+from distutils.spawn import find_executable
+from packager.core import log
+from packager.core import runner
+from packager.core.cache import file_lock
+from packager.core.errors import PublishError
+
+logger = log.get_logger(__name__)
+
+repo_file_template = """[packagebuilder]
+name=CSDMS packages built by packagebuilder
+baseurl=file://{0}
+enabled=1
+gpgcheck=0
+metadata_expire=0
+"""
+
+def rpm_arch(fname):
+    '''
+    Returns the architecture of an RPM from its file name, e.g., "x86_64"
+    for "hydrotrend-3.0.2-1.x86_64.rpm" or "src" for a source RPM.
+    '''
+    return fname[:-len(".rpm")].rsplit(".", 1)[-1]
+
+class Repository(object):
+    '''
+    A local yum repository. `createrepo` is the command used to write
+    the repodata; by default `createrepo_c`, or `createrepo` if it isn't
+    installed.
+    '''
+    def __init__(self, path, createrepo=None):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        if createrepo is None:
+            command = find_executable("createrepo_c") or "createrepo"
+            createrepo = [command]
+        self.createrepo = list(createrepo)
+
+    def publish(self, rpms):
+        '''
+        Copies RPMs into the repository and updates its repodata. Returns
+        a list of the paths to the published RPMs. Builds that publish to
+        the same repository at the same time take turns. Raises
+        PublishError if the RPMs can't be copied or the repodata can't be
+        updated.
+        '''
+        try:
+            return self._publish(rpms)
+        except EnvironmentError as e:
+            raise PublishError("Unable to publish to " + self.path + ": " \
+                               + str(e))
+
+    def _publish(self, rpms):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        published = []
+        replaced = False
+        with file_lock(os.path.join(self.path, ".lock")):
+            for rpm in rpms:
+                fname = os.path.basename(rpm)
+                dest_dir = os.path.join(self.path, rpm_arch(fname))
+                if not os.path.isdir(dest_dir):
+                    os.makedirs(dest_dir)
+                dest = os.path.join(dest_dir, fname)
+                if os.path.isfile(dest):
+                    if filecmp.cmp(rpm, dest, shallow=False):
+                        published.append(dest)
+                        continue
+                    replaced = True
+                tmp = os.path.join(dest_dir, "." + fname + ".part")
+                shutil.copy2(rpm, tmp)
+                os.rename(tmp, dest)
+                published.append(dest)
+                logger.info("Published " + dest)
+            self.update_metadata(full=replaced)
+            with open(os.path.join(self.path, "packagebuilder.repo"), \
+                      "w") as f:
+                f.write(repo_file_template.format(self.path))
+        return published
+
+    def update_metadata(self, full=False):
+        '''
+        Updates the repodata. Unless `full` is True, packages already in
+        the metadata aren't checked for changes.
+        '''
+        cmd = self.createrepo + ["--update", "--quiet"]
+        if not full:
+            cmd.append("--skip-stat")
+        cmd.append(self.path)
+        try:
+            ret = runner.default.run(cmd, log=logger)
+        except OSError:
+            raise PublishError("Unable to run " + self.createrepo[0] + ".")
+        if ret != 0:
+            raise PublishError("Unable to update repository metadata in " \
+                               + self.path + ".")
@@ -1,14 +1,110 @@
 #! /usr/bin/python
 
-from packager.rpm.build import BuildRPM
+from packager.rpm.build import BuildRPM, changed_since
+from packager.core import repo_tools as repo
+from packager.rpm.executor import LocalExecutor
+from packager.core.errors import ModuleNotFound, BuildError, SourceError
+from packager.core import log
 from nose.tools import *
+from nose import with_setup
+import os, shutil
+import tempfile
+from StringIO import StringIO
 
 model_name = "hydrotrend"
 
+# Stands in for an rpmbuild that can't install the BuildRequires.
+failing_rpmbuild = ["sh", "-c", "echo 'error: Failed build dependencies:' "
+                    ">&2; exit 1", "rpmbuild"]
+
+def make_module(repo_dir):
+    '''
+    Makes a module whose source is copied from a local directory.
+    '''
+    module_dir = os.path.join(repo_dir, model_name)
+    src_dir = os.path.join(repo_dir, "src")
+    os.makedirs(module_dir)
+    os.makedirs(src_dir)
+    with open(os.path.join(src_dir, "main.c"), "w") as f:
+        f.write("int main() { return 0; }\n")
+    for fname, text in [(model_name + ".spec", "Name: hydrotrend\n"
+                         "Version: %{_version}\n"
+                         "Source0: hydrotrend-%{_version}.tar.gz\n"),
+                        ("source.txt", "cp -r " + src_dir + "\n"),
+                        ("dependencies.txt", "# Dependencies\n")]:
+        with open(os.path.join(module_dir, fname), "w") as f:
+            f.write(text)
+
+# Setup fixture
+def setup_func():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+# Teardown fixture
+def teardown_func():
+    shutil.rmtree(tmp_dir)
+
 @raises(TypeError)
 def test_fail_with_no_parameters():
     BuildRPM()
 
+@with_setup(setup_func, teardown_func)
+def test_constructor_does_no_work():
+    topdir = os.path.join(tmp_dir, "rpmbuild")
+    BuildRPM(model_name, local_dir=tmp_dir, topdir=topdir)
+    assert_false(os.path.exists(topdir))
+
+@raises(ModuleNotFound)
+@with_setup(setup_func, teardown_func)
+def test_run_module_not_found():
+    BuildRPM(model_name, local_dir=tmp_dir, topdir=tmp_dir).run()
+
+@with_setup(setup_func, teardown_func)
+def test_run_without_raising():
+    result = BuildRPM(model_name, local_dir=tmp_dir, topdir=tmp_dir) \
+        .run(raise_errors=False)
+    assert_false(result.ok)
+    assert_true(isinstance(result.error, ModuleNotFound))
+    assert_equal([step for step, seconds in result.timings], ["plan"])
+
+@with_setup(setup_func, teardown_func)
+def test_quiet_build_shows_errors():
+    make_module(tmp_dir)
+    stream = StringIO()
+    log.configure("WARNING", stream=stream)
+    try:
+        result = BuildRPM(model_name, local_dir=tmp_dir, quiet=True,
+                          topdir=os.path.join(tmp_dir, "rpmbuild"),
+                          executor=LocalExecutor(failing_rpmbuild)) \
+            .run(raise_errors=False)
+    finally:
+        log.configure()
+    assert_true(isinstance(result.error, BuildError))
+    assert_true("error: Failed build dependencies:" in stream.getvalue())
+
+@with_setup(setup_func, teardown_func)
+def test_run_missing_command():
+    make_module(tmp_dir)
+    result = BuildRPM(model_name, local_dir=tmp_dir,
+                      topdir=os.path.join(tmp_dir, "rpmbuild"),
+                      executor=LocalExecutor(["no-such-rpmbuild"])) \
+        .run(raise_errors=False)
+    assert_true(isinstance(result.error, BuildError))
+    assert_equal(result.timings[-1][0], "build")
+
+@raises(SourceError)
+@with_setup(setup_func, teardown_func)
+def test_changed_since_missing_index_fails():
+    make_module(tmp_dir)
+    changed_since(os.path.join(tmp_dir, "nowhere", "idx.json"), tmp_dir)
+
+@with_setup(setup_func, teardown_func)
+def test_changed_since_index():
+    make_module(tmp_dir)
+    index_file = os.path.join(tmp_dir, "idx.json")
+    repo.save_index({}, index_file)
+    assert_equal(changed_since(index_file, tmp_dir), [(model_name, [])])
+
 # def test_model_version_none():
 #     BuildRPM(model_name, None, None, None, None)
 
@@ -0,0 +1,109 @@
+#! /usr/bin/env python
+
+from packager.rpm.buildroot import Buildroot, parse_dependencies, \
+    dependency_key
+from packager.core.cache import Cache
+from packager.core.errors import BuildError
+from nose.plugins.skip import SkipTest
+from nose.tools import *
+from nose import with_setup
+import os, shutil
+import logging
+import tempfile
+
+logger = logging.getLogger("packager.test")
+
+# Stands in for yum: records the packages "installed" in the root.
+fake_installer = ["sh", "-c", 'mkdir -p "$0/var" && echo "$@" >> '
+                  '"$0/var/installed"', "{root}"]
+
+# Setup fixture
+def setup_func():
+    global tmp_dir, buildroot
+    tmp_dir = tempfile.mkdtemp()
+    buildroot = Buildroot(Cache(os.path.join(tmp_dir, "cache")),
+                          installer=fake_installer, packages=["bash"],
+                          mode="copy", workdir=tmp_dir, mounts=False)
+
+# Teardown fixture
+def teardown_func():
+    shutil.rmtree(tmp_dir)
+
+def installed(root):
+    with open(os.path.join(root, "var", "installed")) as f:
+        return f.read().split()
+
+def test_parse_dependencies():
+    assert_equal(parse_dependencies("gcc, netcdf-devel,  gcc"),
+                 ["gcc", "netcdf-devel"])
+
+def test_dependency_key_ignores_order():
+    assert_equal(dependency_key(["a", "b"]), dependency_key(["b", "a", "a"]))
+    assert_not_equal(dependency_key(["a"]), dependency_key(["a", "b"]))
+
+@with_setup(setup_func, teardown_func)
+def test_image():
+    image = buildroot.image(["netcdf-devel", "bash"], logger)
+    assert_equal(installed(image), ["bash", "netcdf-devel"])
+
+@with_setup(setup_func, teardown_func)
+def test_image_reused():
+    first = buildroot.image(["netcdf-devel"], logger)
+    buildroot.installer = ["false"]
+    assert_equal(buildroot.image(["netcdf-devel"], logger), first)
+    assert_equal(buildroot.cache.stats()["buildroots"][0], 2)
+
+@with_setup(setup_func, teardown_func)
+def test_image_uses_published_repo():
+    repo_dir = os.path.join(tmp_dir, "repo")
+    for dname in ("repodata", "x86_64", "src"):
+        os.makedirs(os.path.join(repo_dir, dname))
+    buildroot.repos = [repo_dir]
+    assert_equal(buildroot.repo_options(), [])
+    with open(os.path.join(repo_dir, "repodata", "repomd.xml"), "w") as f:
+        f.write("")
+    def publish(fname):
+        with open(os.path.join(repo_dir, fname), "w") as f:
+            f.write(fname)
+    publish("x86_64/babel-1.4.0-1.x86_64.rpm")
+    publish("src/babel-1.4.0-1.src.rpm")
+    assert_equal(buildroot.published().keys(), ["babel"])
+    assert_equal(buildroot.key([]), dependency_key(["bash"]))
+    first = buildroot.key(["babel"])
+    distro_only = buildroot.key(["netcdf-devel"])
+    image = buildroot.image(["babel"], logger)
+    assert_true("--repofrompath=packagebuilder0,file://" + repo_dir \
+                in installed(image))
+    publish("x86_64/babel-1.4.0-2.x86_64.rpm")
+    publish("x86_64/cem-0.2-1.x86_64.rpm")
+    assert_not_equal(buildroot.key(["babel"]), first)
+    assert_equal(buildroot.key(["netcdf-devel"]), distro_only)
+    assert_equal(buildroot.key([]), dependency_key(["bash"]))
+
+@with_setup(setup_func, teardown_func)
+def test_checkout_and_release():
+    image = buildroot.image([], logger)
+    root = buildroot.checkout(image)
+    with open(os.path.join(root, "var", "installed"), "a") as f:
+        f.write("scratch\n")
+    assert_equal(installed(image), ["bash"])
+    buildroot.release(root)
+    assert_false(os.path.exists(root))
+
+@with_setup(setup_func, teardown_func)
+def test_checkout_mounts_special_filesystems():
+    if os.geteuid() != 0:
+        raise SkipTest("mounting needs root")
+    buildroot.mounts = True
+    image = buildroot.image([], logger)
+    try:
+        root = buildroot.checkout(image, logger)
+    except BuildError:
+        raise SkipTest("unable to mount here")
+    try:
+        assert_true(os.path.exists(os.path.join(root, "dev", "null")))
+        assert_true(os.path.isdir(os.path.join(root, "proc", "self")))
+    finally:
+        buildroot.release(root, logger)
+    assert_false(os.path.exists(root))
+    assert_true(os.path.exists("/dev/null"))
@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+
+from packager.rpm import executor
+from packager.rpm.worker import Worker
+from packager.core.errors import BuildError
+from nose.tools import *
+from nose import with_setup
+import os, shutil
+import logging
+import socket
+import tarfile
+import tempfile
+import threading
+import time
+from StringIO import StringIO
+
+logger = logging.getLogger("packager.test")
+
+# Stands in for rpmbuild: checks the spec was staged, then "builds" an RPM.
+fake_rpmbuild = ["sh", "-c", "test -f SPECS/foo.spec && echo building && "
+                 "mkdir -p RPMS/noarch && cp SOURCES/foo.tar.gz "
+                 "RPMS/noarch/foo.rpm", "rpmbuild"]
+
+# Setup fixture
+def setup_func():
+    global tmp_dir, worker, thread
+    tmp_dir = tempfile.mkdtemp()
+    for dname, fname in [("SOURCES", "foo.tar.gz"), ("SPECS", "foo.spec")]:
+        os.makedirs(os.path.join(tmp_dir, dname))
+        with open(os.path.join(tmp_dir, dname, fname), "w") as f:
+            f.write(fname)
+    worker = Worker(("127.0.0.1", 0), command=fake_rpmbuild)
+    thread = threading.Thread(target=worker.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+# Teardown fixture
+def teardown_func():
+    worker.shutdown()
+    worker.server_close()
+    shutil.rmtree(tmp_dir)
+
+def worker_url():
+    return "http://127.0.0.1:{0}".format(worker.server_address[1])
+
+def test_from_url():
+    assert_true(isinstance(executor.from_url(None), executor.LocalExecutor))
+    assert_true(isinstance(executor.from_url("ssh://build@host"),
+                           executor.SSHExecutor))
+    assert_true(isinstance(executor.from_url("http://host:8642"),
+                           executor.HTTPExecutor))
+
+@raises(ValueError)
+def test_from_url_unknown_fails():
+    executor.from_url("ftp://host")
+
+@with_setup(setup_func, teardown_func)
+def test_local_executor():
+    e = executor.LocalExecutor(command=fake_rpmbuild)
+    assert_equal(e.build(tmp_dir, ["-ba", "SPECS/foo.spec"], logger), 0)
+    assert_true(os.path.isfile(os.path.join(tmp_dir, "RPMS/noarch/foo.rpm")))
+
+@raises(BuildError)
+@with_setup(setup_func, teardown_func)
+def test_local_executor_missing_command_fails():
+    executor.LocalExecutor(command=["no-such-rpmbuild"]) \
+        .build(tmp_dir, ["-ba", "SPECS/foo.spec"], logger)
+
+@raises(BuildError)
+@with_setup(setup_func, teardown_func)
+def test_ssh_executor_missing_command_fails():
+    executor.SSHExecutor("buildhost", ssh=["no-such-ssh"]) \
+        .build(tmp_dir, ["-ba", "SPECS/foo.spec"], logger)
+
+@with_setup(setup_func, teardown_func)
+def test_http_executor():
+    e = executor.HTTPExecutor(worker_url())
+    assert_equal(e.build(tmp_dir, ["-ba", "SPECS/foo.spec"], logger), 0)
+    with open(os.path.join(tmp_dir, "RPMS/noarch/foo.rpm")) as f:
+        assert_equal(f.read(), "foo.tar.gz")
+
+@with_setup(setup_func, teardown_func)
+def test_http_executor_build_fails():
+    os.remove(os.path.join(tmp_dir, "SPECS", "foo.spec"))
+    e = executor.HTTPExecutor(worker_url())
+    assert_equal(e.build(tmp_dir, ["-ba", "SPECS/foo.spec"], logger), 1)
+
+@raises(BuildError)
+@with_setup(setup_func, teardown_func)
+def test_http_executor_timeout():
+    worker.command = ["sh", "-c", "sleep 10", "rpmbuild"]
+    executor.HTTPExecutor(worker_url()).build(tmp_dir, [], logger, timeout=0.2)
+
+@with_setup(setup_func, teardown_func)
+def test_http_executor_hung_worker_fails():
+    hung = socket.socket()
+    hung.bind(("127.0.0.1", 0))
+    hung.listen(1) # accepts connections, never answers
+    e = executor.HTTPExecutor("http://127.0.0.1:{0}".format(
+        hung.getsockname()[1]))
+    e.worker_grace = 0.2
+    start = time.time()
+    try:
+        assert_raises(BuildError, e.build, tmp_dir, [], logger, timeout=0.1)
+    finally:
+        hung.close()
+    assert_true(time.time() - start < 5)
+
+def make_tarball(members):
+    '''
+    Returns a gzipped tarball, in an open file, holding the given
+    (name, type, link name) members.
+    '''
+    fileobj = tempfile.TemporaryFile()
+    tar = tarfile.open(fileobj=fileobj, mode="w:gz")
+    for name, kind, linkname in members:
+        info = tarfile.TarInfo(name)
+        info.type = kind
+        info.linkname = linkname
+        tar.addfile(info, StringIO() if kind == tarfile.REGTYPE else None)
+    tar.close()
+    fileobj.seek(0)
+    return fileobj
+
+@with_setup(setup_func, teardown_func)
+def test_unpack_refuses_escaping_links():
+    outside = tempfile.mkdtemp()
+    try:
+        for members in ([("RPMS/x", tarfile.SYMTYPE, outside),
+                         ("RPMS/x/passwd", tarfile.REGTYPE, "")],
+                        [("RPMS/y", tarfile.SYMTYPE, "../../etc")],
+                        [("RPMS/z", tarfile.LNKTYPE, "../etc/passwd")],
+                        [("../escaped", tarfile.REGTYPE, "")]):
+            assert_raises(BuildError, executor.unpack,
+                          make_tarball(members), tmp_dir)
+        assert_equal(os.listdir(outside), [])
+    finally:
+        shutil.rmtree(outside)
+    executor.unpack(make_tarball([("RPMS/a", tarfile.REGTYPE, ""),
+                                  ("RPMS/b", tarfile.SYMTYPE, "a")]), tmp_dir)
+    assert_true(os.path.islink(os.path.join(tmp_dir, "RPMS", "b")))
+
+@raises(BuildError)
+def test_http_executor_no_worker_fails():
+    tmp = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(tmp, "SOURCES"))
+        os.makedirs(os.path.join(tmp, "SPECS"))
+        executor.HTTPExecutor("http://127.0.0.1:1").build(tmp, [], logger)
+    finally:
+        shutil.rmtree(tmp)
+
+@with_setup(setup_func, teardown_func)
+def test_ssh_executor():
+    remote_dir = os.path.join(tmp_dir, "remote")
+    os.makedirs(remote_dir)
+    fake_ssh = ["sh", "-c", 'eval "$2"', "ssh"] # runs "remote" cmd locally
+    e = executor.SSHExecutor("buildhost", remote_dir=remote_dir,
+                             ssh=fake_ssh, command=fake_rpmbuild)
+    assert_equal(e.build(tmp_dir, ["-ba", "SPECS/foo.spec"], logger), 0)
+    assert_true(os.path.isfile(os.path.join(tmp_dir, "RPMS/noarch/foo.rpm")))
+    assert_equal(os.listdir(remote_dir), [])
+
+@with_setup(setup_func, teardown_func)
+def test_ssh_executor_timeout_stops_remote_build():
+    remote_dir = os.path.join(tmp_dir, "remote")
+    os.makedirs(remote_dir)
+    fake_ssh = ["sh", "-c", 'eval "$2"', "ssh"]
+    e = executor.SSHExecutor("buildhost", remote_dir=remote_dir,
+                             ssh=fake_ssh,
+                             command=["sh", "-c", "sleep 10", "rpmbuild"])
+    start = time.time()
+    assert_raises(BuildError, e.build, tmp_dir, ["-ba"], logger, 0.5)
+    assert_true(time.time() - start < 5)
+    assert_equal(os.listdir(remote_dir), [])
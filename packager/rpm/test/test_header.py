@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+
+from packager.rpm import header as h
+from packager.core.errors import ArtifactError
+from nose.tools import *
+from nose import with_setup
+import os, shutil
+import struct
+import hashlib
+import tempfile
+
+_sizes = {h.INT16: 2, h.INT32: 4, h.INT64: 8}
+
+def header_bytes(entries):
+    '''
+    Returns a header structure holding the given (tag, type, value)
+    entries.
+    '''
+    index = ""
+    store = ""
+    for tag, kind, value in sorted(entries):
+        if kind == h.STRING:
+            data, count = value + "\0", 1
+        elif kind in (h.STRING_ARRAY, h.I18NSTRING):
+            data, count = "".join(v + "\0" for v in value), len(value)
+        elif kind == h.BIN:
+            data, count = value, len(value)
+        else:
+            align = _sizes.get(kind, 1)
+            store += "\0" * ((align - len(store) % align) % align)
+            data = struct.pack(">" + str(len(value)) + h._int_formats[kind],
+                               *value)
+            count = len(value)
+        index += struct.pack(">IIII", tag, kind, len(store), count)
+        store += data
+    return h.header_magic + "\0" * 4 \
+        + struct.pack(">II", len(entries), len(store)) + index + store
+
+def make_rpm(path, name="foo", version="1.0", arch="x86_64", source=False,
+             files=("/usr/local/bin/foo", "/usr/local/share/foo/data"),
+             provides=(("foo", 8, "1.0-1"),),
+             requires=(("libc.so.6", 0, ""), ("bar", 12, "2.0")),
+             payload="compressed payload", payload_digest=True):
+    '''
+    Writes a minimal RPM file.
+    '''
+    dirnames = sorted(set(os.path.dirname(f) + "/" for f in files))
+    entries = [
+        (h.NAME, h.STRING, name),
+        (h.VERSION, h.STRING, version),
+        (h.RELEASE, h.STRING, "1"),
+        (h.SUMMARY, h.I18NSTRING, ["The " + name + " model"]),
+        (h.ARCH, h.STRING, arch),
+        (h.DIRNAMES, h.STRING_ARRAY, dirnames),
+        (h.BASENAMES, h.STRING_ARRAY, [os.path.basename(f) for f in files]),
+        (h.DIRINDEXES, h.INT32,
+         [dirnames.index(os.path.dirname(f) + "/") for f in files]),
+        (h.FILESIZES, h.INT32, [len(f) for f in files]),
+        (h.FILEMODES, h.INT16, [0100755] * len(files)),
+        (h.FILEDIGESTS, h.STRING_ARRAY,
+         [hashlib.sha256(f).hexdigest() for f in files]),
+        (h.FILEFLAGS, h.INT32, [0] * len(files)),
+        (h.FILEDIGESTALGO, h.INT32, [8]),
+        (h.PROVIDENAME, h.STRING_ARRAY, [p[0] for p in provides]),
+        (h.PROVIDEFLAGS, h.INT32, [p[1] for p in provides]),
+        (h.PROVIDEVERSION, h.STRING_ARRAY, [p[2] for p in provides]),
+        (h.REQUIRENAME, h.STRING_ARRAY, [r[0] for r in requires]),
+        (h.REQUIREFLAGS, h.INT32, [r[1] for r in requires]),
+        (h.REQUIREVERSION, h.STRING_ARRAY, [r[2] for r in requires]),
+        ]
+    if not source:
+        entries.append((h.SOURCERPM, h.STRING, name + "-" + version
+                        + "-1.src.rpm"))
+    if payload_digest:
+        entries.append((h.PAYLOADDIGEST, h.STRING_ARRAY,
+                        [hashlib.sha256(payload).hexdigest()]))
+        entries.append((h.PAYLOADDIGESTALGO, h.INT32, [8]))
+    main = header_bytes(entries)
+    signature = header_bytes([
+        (h.SIG_SIZE, h.INT32, [len(main + payload)]),
+        (h.SIG_MD5, h.BIN, hashlib.md5(main + payload).digest()),
+        (h.SIG_SHA256, h.STRING, hashlib.sha256(main).hexdigest()),
+        ])
+    lead = h.lead_magic + "\x03\x00" + struct.pack(">H", int(source))
+    lead += "\0" * (h.lead_size - len(lead))
+    with open(path, "wb") as f:
+        f.write(lead + signature + "\0" * ((8 - len(signature) % 8) % 8))
+        f.write(main + payload)
+    return path
+
+# Setup fixture
+def setup_func():
+    global tmp_dir, rpm
+    tmp_dir = tempfile.mkdtemp()
+    rpm = make_rpm(os.path.join(tmp_dir, "foo-1.0-1.x86_64.rpm"))
+
+# Teardown fixture
+def teardown_func():
+    shutil.rmtree(tmp_dir)
+
+def corrupt(path, offset, data="XX"):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+@with_setup(setup_func, teardown_func)
+def test_read():
+    header = h.read(rpm)
+    assert_equal(header.name, "foo")
+    assert_equal(header.version, "1.0")
+    assert_equal(header.release, "1")
+    assert_equal(header.epoch, None)
+    assert_equal(header.summary, "The foo model")
+    assert_equal(header.nevra, "foo-1.0-1.x86_64")
+    assert_false(header.is_source)
+    assert_equal(header.digest_algorithm, "sha256")
+
+@with_setup(setup_func, teardown_func)
+def test_files():
+    files = h.read(rpm).files()
+    assert_equal([f[0] for f in files],
+                 ["/usr/local/bin/foo", "/usr/local/share/foo/data"])
+    path, size, mode, digest, flags = files[0]
+    assert_equal(size, len(path))
+    assert_equal(mode, 0100755)
+    assert_equal(digest, hashlib.sha256(path).hexdigest())
+
+@with_setup(setup_func, teardown_func)
+def test_dependencies():
+    header = h.read(rpm)
+    assert_equal(header.provides(), [("foo", "=", "1.0-1")])
+    assert_equal(header.requires(), [("libc.so.6", "", ""),
+                                     ("bar", ">=", "2.0")])
+
+@with_setup(setup_func, teardown_func)
+def test_source_rpm():
+    path = make_rpm(os.path.join(tmp_dir, "foo-1.0-1.src.rpm"), source=True)
+    header = h.read(path)
+    assert_true(header.is_source)
+    assert_equal(header.nevra, "foo-1.0-1.src")
+
+@raises(ArtifactError)
+@with_setup(setup_func, teardown_func)
+def test_not_an_rpm():
+    with open(rpm, "wb") as f:
+        f.write("not an rpm")
+    h.read(rpm)
+
+@raises(ArtifactError)
+@with_setup(setup_func, teardown_func)
+def test_truncated():
+    with open(rpm, "r+b") as f:
+        f.truncate(200)
+    h.read(rpm)
+
+@with_setup(setup_func, teardown_func)
+def test_digests_ok():
+    assert_equal(h.check_digests(h.read(rpm)), [])
+
+@with_setup(setup_func, teardown_func)
+def test_bad_payload_digest():
+    corrupt(rpm, os.path.getsize(rpm) - 2)
+    header = h.read(rpm)
+    assert_equal(h.check_digests(header, check_payload=False), [])
+    assert_equal(h.check_digests(header),
+                 ["foo-1.0-1.x86_64.rpm has a bad payload digest."])
+
+@with_setup(setup_func, teardown_func)
+def test_bad_md5_payload_digest():
+    make_rpm(rpm, payload_digest=False)
+    assert_equal(h.check_digests(h.read(rpm)), [])
+    corrupt(rpm, os.path.getsize(rpm) - 2)
+    assert_equal(h.check_digests(h.read(rpm)),
+                 ["foo-1.0-1.x86_64.rpm has a bad payload digest."])
+
+@with_setup(setup_func, teardown_func)
+def test_bad_header_digest():
+    header = h.read(rpm)
+    corrupt(rpm, header.payload_offset - 4, "Z")
+    assert_true("foo-1.0-1.x86_64.rpm has a bad header digest."
+                in h.check_digests(h.read(rpm), check_payload=False))
@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+
+from packager.rpm.manifest import Manifest
+from packager.rpm.test.test_header import make_rpm
+from nose.tools import *
+from nose import with_setup
+import os, shutil
+import tempfile
+
+# Setup fixture
+def setup_func():
+    global tmp_dir, manifest, rpms
+    tmp_dir = tempfile.mkdtemp()
+    manifest = Manifest(os.path.join(tmp_dir, "db", "manifest.db"))
+    rpms = [make_rpm(os.path.join(tmp_dir, "foo-1.0-1.x86_64.rpm")),
+            make_rpm(os.path.join(tmp_dir, "bar-2.0-1.x86_64.rpm"),
+                     name="bar", version="2.0",
+                     files=("/usr/local/bin/bar",),
+                     provides=(("bar", 8, "2.0-1"),), requires=())]
+    manifest.add_files(rpms)
+
+# Teardown fixture
+def teardown_func():
+    manifest.close()
+    shutil.rmtree(tmp_dir)
+
+@with_setup(setup_func, teardown_func)
+def test_packages():
+    assert_equal(manifest.packages(),
+                 [("bar-2.0-1.x86_64", rpms[1]),
+                  ("foo-1.0-1.x86_64", rpms[0])])
+    assert_equal(manifest.packages("foo"), [("foo-1.0-1.x86_64", rpms[0])])
+
+@with_setup(setup_func, teardown_func)
+def test_files():
+    files = manifest.files("foo-1.0-1.x86_64")
+    assert_equal([f[0] for f in files],
+                 ["/usr/local/bin/foo", "/usr/local/share/foo/data"])
+
+@with_setup(setup_func, teardown_func)
+def test_queries():
+    assert_equal(manifest.owners("/usr/local/bin/bar"), ["bar-2.0-1.x86_64"])
+    assert_equal(manifest.whatprovides("bar"), ["bar-2.0-1.x86_64"])
+    assert_equal(manifest.whatrequires("bar"), ["foo-1.0-1.x86_64"])
+    assert_equal(manifest.owners("/nowhere"), [])
+
+@with_setup(setup_func, teardown_func)
+def test_non_ascii_strings():
+    name = "/usr/local/share/foo/caf\xc3\xa9"
+    rpm = make_rpm(os.path.join(tmp_dir, "baz-1.0-1.x86_64.rpm"),
+                   name="baz", files=(name, "/usr/local/share/foo/\xff"))
+    manifest.add_files([rpm])
+    assert_equal(manifest.owners(name), ["baz-1.0-1.x86_64"])
+    assert_equal([f[0] for f in manifest.files("baz-1.0-1.x86_64")],
+                 [u"/usr/local/share/foo/caf\xe9",
+                  u"/usr/local/share/foo/\ufffd"])
+
+@with_setup(setup_func, teardown_func)
+def test_add_replaces():
+    manifest.add_files(rpms[:1])
+    assert_equal(len(manifest.packages()), 2)
+    assert_equal(manifest.owners("/usr/local/bin/foo"), ["foo-1.0-1.x86_64"])
+
+@with_setup(setup_func, teardown_func)
+def test_add_records_paths():
+    published = os.path.join(tmp_dir, "repo", "x86_64",
+                             os.path.basename(rpms[0]))
+    headers = manifest.add_files(rpms[:1])
+    manifest.add(headers, [published])
+    assert_equal(manifest.packages("foo"), [("foo-1.0-1.x86_64", published)])
+
+@with_setup(setup_func, teardown_func)
+def test_remove():
+    manifest.remove("foo-1.0-1.x86_64")
+    assert_equal(manifest.packages("foo"), [])
+    assert_equal(manifest.files("foo-1.0-1.x86_64"), [])
+
+@with_setup(setup_func, teardown_func)
+def test_reopen():
+    manifest.close()
+    reopened = Manifest(manifest.path)
+    try:
+        assert_equal(len(reopened.packages()), 2)
+    finally:
+        reopened.close()
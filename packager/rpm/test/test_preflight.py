@@ -0,0 +1,149 @@
+#! /usr/bin/env python
+
+from packager.rpm import preflight as pf
+from packager.core.cache import Cache
+from packager.core.errors import PreflightError
+from nose.tools import *
+from nose import with_setup
+import os, shutil
+import tempfile
+
+spec = """%define srcname %{name}-%{_version}
+Name: hydrotrend
+Version: %{_version}
+Source0: %{srcname}.tar.gz
+Source1: hydrotrend.sh
+Patch0: hydrotrend-makefile.patch
+BuildRequires: gcc >= 4.1, %{?_buildrequires}
+
+%changelog
+Source9: not-a-tag.txt
+"""
+macros = {"_version": "3.0.2", "_buildrequires": "netcdf-devel"}
+tarball = "hydrotrend-3.0.2.tar.gz"
+
+# Setup fixture
+def setup_func():
+    global tmp_dir, spec_file
+    tmp_dir = tempfile.mkdtemp()
+    spec_file = os.path.join(tmp_dir, "hydrotrend.spec")
+    for fname, text in [("hydrotrend.spec", spec), ("hydrotrend.sh", ""),
+                        ("hydrotrend-makefile.patch", "")]:
+        with open(os.path.join(tmp_dir, fname), "w") as f:
+            f.write(text)
+
+# Teardown fixture
+def teardown_func():
+    shutil.rmtree(tmp_dir)
+
+def test_expand():
+    assert_equal(pf.expand("%{name}-%version", {"name": "a", "version": "1"}),
+                 "a-1")
+    assert_equal(pf.expand("x%{?unset}", {}), "x")
+    assert_equal(pf.expand("%{_datadir}", {}), "%{_datadir}")
+
+def test_parse_spec():
+    tags = pf.parse_spec(spec, macros)
+    assert_equal(tags["name"], "hydrotrend")
+    assert_equal(tags["version"], "3.0.2")
+    assert_equal(tags["source0"], [tarball])
+    assert_equal(tags["buildrequires"], ["gcc >= 4.1, netcdf-devel"])
+    assert_false("source9" in tags)
+
+def test_requirement_names():
+    assert_equal(pf.requirement_names(["gcc >= 4.1, netcdf-devel", "make"]),
+                 ["gcc", "netcdf-devel", "make"])
+
+@with_setup(setup_func, teardown_func)
+def test_check_spec():
+    assert_equal(pf.check_spec(spec_file, tmp_dir, macros, tarball), [])
+
+@with_setup(setup_func, teardown_func)
+def test_check_spec_problems():
+    os.remove(os.path.join(tmp_dir, "hydrotrend.sh"))
+    problems = pf.check_spec(spec_file, tmp_dir, {}, tarball)
+    assert_equal(len(problems), 4) # version, tarball (x2), script
+
+@with_setup(setup_func, teardown_func)
+def test_check_spec_source_not_copied():
+    with open(spec_file, "w") as f:
+        f.write("Source2: hydrotrend.cfg\n" + spec)
+    with open(os.path.join(tmp_dir, "hydrotrend.cfg"), "w") as f:
+        f.write("")
+    problems = pf.check_spec(spec_file, tmp_dir, macros, tarball)
+    assert_equal(len(problems), 1)
+    assert_true("hydrotrend.cfg isn't copied" in problems[0])
+
+@with_setup(setup_func, teardown_func)
+def test_check_spec_without_requires():
+    with open(spec_file, "w") as f:
+        f.write(spec.replace("%{?_buildrequires}", "%{_buildrequires}"))
+    debian_macros = {"_version": "3.0.2"}
+    assert_equal(len(pf.check_spec(spec_file, tmp_dir, debian_macros,
+                                   tarball)), 1)
+    assert_equal(pf.check_spec(spec_file, tmp_dir, debian_macros, tarball,
+                               check_requires=False), [])
+
+@with_setup(setup_func, teardown_func)
+def test_check_spec_missing():
+    os.remove(spec_file)
+    assert_equal(len(pf.check_spec(spec_file, tmp_dir, macros, tarball)), 1)
+
+@raises(PreflightError)
+@with_setup(setup_func, teardown_func)
+def test_preflight_fails():
+    pf.preflight(spec_file, tmp_dir, macros, "cem-0.2.tar.gz",
+                 check_dependencies=False)
+
+@with_setup(setup_func, teardown_func)
+def test_preflight_cached():
+    cache = Cache(os.path.join(tmp_dir, "cache"))
+    pf.preflight(spec_file, tmp_dir, macros, tarball, cache=cache,
+                 check_dependencies=False)
+    assert_equal(cache.stats()["preflight"][0], 1)
+    pf.preflight(spec_file, tmp_dir, macros, tarball, cache=cache,
+                 check_dependencies=False)
+    assert_equal(cache.stats()["preflight"][0], 1)
+    with open(os.path.join(tmp_dir, "hydrotrend.sh"), "w") as f:
+        f.write("changed")
+    pf.preflight(spec_file, tmp_dir, macros, tarball, cache=cache,
+                 check_dependencies=False)
+    assert_equal(cache.stats()["preflight"][0], 2)
+
+@with_setup(setup_func, teardown_func)
+def test_digest_sees_other_files():
+    before = pf.digest(tmp_dir, macros, tarball)
+    with open(os.path.join(tmp_dir, "hydrotrend.cfg"), "w") as f:
+        f.write("")
+    assert_not_equal(pf.digest(tmp_dir, macros, tarball), before)
+    assert_not_equal(pf.digest(tmp_dir, macros, tarball, False),
+                     pf.digest(tmp_dir, macros, tarball))
+
+conditional_spec = """Name: hydrotrend
+Version: 3.0.2
+Source0: hydrotrend-3.0.2.tar.gz
+%if 0%{?rhel}
+BuildRequires: %{?_rhel_requires}
+Source1: rhel-only.patch
+%else
+BuildRequires: not-an-installed-package
+%endif
+
+%description
+Source2: not-a-tag.txt
+"""
+
+@with_setup(setup_func, teardown_func)
+def test_check_spec_conditional():
+    with open(spec_file, "w") as f:
+        f.write(conditional_spec)
+    tags = pf.parse_spec(conditional_spec)
+    assert_false("buildrequires" in tags)
+    assert_false("source2" in tags)
+    tags = pf.parse_spec(conditional_spec, conditional=True)
+    assert_equal(len(tags["buildrequires"]), 2)
+    warnings = []
+    assert_equal(pf.check_spec(spec_file, tmp_dir, {}, tarball, True,
+                               warnings), [])
+    assert_equal(len(warnings), 2)
+    pf.preflight(spec_file, tmp_dir, {}, tarball)
@@ -0,0 +1,61 @@
+#! /usr/bin/env python
+
+from packager.rpm.publish import Repository, rpm_arch
+from packager.core.errors import PublishError
+from nose.tools import *
+from nose import with_setup
+import os, shutil
+import tempfile
+
+# Stands in for createrepo_c: records its arguments in the repodata.
+fake_createrepo = ["sh", "-c", 'for a; do repo=$a; done; mkdir -p '
+                   '"$repo/repodata" && echo "$@" > "$repo/repodata/args"',
+                   "createrepo_c"]
+
+# Setup fixture
+def setup_func():
+    global tmp_dir, repo, rpms
+    tmp_dir = tempfile.mkdtemp()
+    repo = Repository(os.path.join(tmp_dir, "repo"),
+                      createrepo=fake_createrepo)
+    rpms = []
+    for fname in ["foo-1.0-1.x86_64.rpm", "foo-1.0-1.src.rpm"]:
+        rpms.append(os.path.join(tmp_dir, fname))
+        with open(rpms[-1], "w") as f:
+            f.write(fname)
+
+# Teardown fixture
+def teardown_func():
+    shutil.rmtree(tmp_dir)
+
+def createrepo_args():
+    with open(os.path.join(repo.path, "repodata", "args")) as f:
+        return f.read().split()
+
+def test_rpm_arch():
+    assert_equal(rpm_arch("hydrotrend-3.0.2-1.x86_64.rpm"), "x86_64")
+    assert_equal(rpm_arch("hydrotrend-3.0.2-1.src.rpm"), "src")
+
+@with_setup(setup_func, teardown_func)
+def test_publish():
+    published = repo.publish(rpms)
+    assert_equal(published,
+                 [os.path.join(repo.path, "x86_64", "foo-1.0-1.x86_64.rpm"),
+                  os.path.join(repo.path, "src", "foo-1.0-1.src.rpm")])
+    assert_true("--skip-stat" in createrepo_args())
+    assert_true(os.path.isfile(os.path.join(repo.path,
+                                            "packagebuilder.repo")))
+
+@with_setup(setup_func, teardown_func)
+def test_publish_replaced_rpm_checks_all():
+    repo.publish(rpms)
+    with open(rpms[0], "w") as f:
+        f.write("rebuilt")
+    repo.publish(rpms)
+    assert_false("--skip-stat" in createrepo_args())
+
+@raises(PublishError)
+@with_setup(setup_func, teardown_func)
+def test_publish_fails():
+    repo.createrepo = ["false"]
+    repo.publish(rpms)
@@ -0,0 +1,63 @@
+#! /usr/bin/env python
+
+from packager.rpm.verify import verify, is_under
+from packager.rpm.test.test_header import make_rpm
+from packager.core.errors import ArtifactError
+from nose.tools import *
+from nose import with_setup
+import os, shutil
+import tempfile
+
+# Setup fixture
+def setup_func():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+# Teardown fixture
+def teardown_func():
+    shutil.rmtree(tmp_dir)
+
+def test_is_under():
+    assert_true(is_under("/usr/local/bin/foo", "/usr/local"))
+    assert_true(is_under("/usr/local", "/usr/local/"))
+    assert_false(is_under("/usr/localfoo", "/usr/local"))
+
+@with_setup(setup_func, teardown_func)
+def test_verify():
+    rpms = [make_rpm(os.path.join(tmp_dir, "foo-1.0-1.x86_64.rpm")),
+            make_rpm(os.path.join(tmp_dir, "foo-1.0-1.src.rpm"),
+                     source=True, files=("foo.spec", "foo-1.0.tar.gz"))]
+    headers = verify(rpms, "/usr/local")
+    assert_equal([header.nevra for header in headers],
+                 ["foo-1.0-1.x86_64", "foo-1.0-1.src"])
+
+@with_setup(setup_func, teardown_func)
+def test_verify_build_id_allowed():
+    rpm = make_rpm(os.path.join(tmp_dir, "foo-1.0-1.x86_64.rpm"),
+                   files=("/opt/foo/bin/foo", "/usr/lib/.build-id/ab/cdef"))
+    assert_equal(len(verify([rpm], "/opt/foo")), 1)
+
+@with_setup(setup_func, teardown_func)
+def test_verify_outside_prefix():
+    rpm = make_rpm(os.path.join(tmp_dir, "foo-1.0-1.x86_64.rpm"))
+    try:
+        verify([rpm], "/usr/local/csdms")
+    except ArtifactError as e:
+        assert_equal(len(e.problems), 1)
+        assert_true("outside /usr/local/csdms" in e.problems[0])
+        assert_true("/usr/local/bin/foo" in e.problems[0])
+    else:
+        assert_true(False, "ArtifactError not raised")
+
+@with_setup(setup_func, teardown_func)
+def test_verify_collects_problems():
+    bad = os.path.join(tmp_dir, "bar-1.0-1.x86_64.rpm")
+    with open(bad, "w") as f:
+        f.write("not an rpm")
+    rpm = make_rpm(os.path.join(tmp_dir, "foo-1.0-1.x86_64.rpm"))
+    try:
+        verify([bad, rpm], "/opt")
+    except ArtifactError as e:
+        assert_equal(len(e.problems), 2)
+    else:
+        assert_true(False, "ArtifactError not raised")
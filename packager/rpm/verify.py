@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+#
+# Checks the RPMs produced by a build, reading their headers in-process
+# (see `header`). Each package's header and payload digests are checked,
+# and every file in a binary package must be installed under the install
+# prefix, except for the debugging files that `rpmbuild` adds.
+
+import os
+from packager.core import log
+from packager.rpm import header as rpm_header
+from packager.core.errors import ArtifactError
+
+logger = log.get_logger(__name__)
+
+allowed_dirs = ("/usr/lib/.build-id", "/usr/lib/debug", "/usr/src/debug")
+
+def is_under(path, directory):
+    '''
+    Returns True if `path` is `directory` or is inside it.
+    '''
+    directory = directory.rstrip("/")
+    return path == directory or path.startswith(directory + "/")
+
+def check_prefix(header, prefix):
+    '''
+    Returns a list of the problems found checking that the files in a
+    binary package are installed under `prefix`.
+    '''
+    outside = [f[0] for f in header.files() if not is_under(f[0], prefix) \
+               and not any(is_under(f[0], d) for d in allowed_dirs)]
+    if len(outside) == 0:
+        return []
+    more = "" if len(outside) <= 5 \
+           else " and " + str(len(outside) - 5) + " more"
+    return [os.path.basename(header.path) + " installs files outside " \
+            + prefix + ": " + ", ".join(outside[:5]) + more + "."]
+
+def verify(rpms, prefix, check_payload=True):
+    '''
+    Checks a list of RPM files, raising ArtifactError with all the
+    problems found. Returns a list of their headers. If `check_payload`
+    is False, only the headers are read.
+    '''
+    headers = []
+    problems = []
+    for path in rpms:
+        try:
+            header = rpm_header.read(path)
+        except ArtifactError as e:
+            problems.extend(e.problems)
+            continue
+        problems.extend(rpm_header.check_digests(header, check_payload))
+        if not header.is_source:
+            problems.extend(check_prefix(header, prefix))
+        headers.append(header)
+    if len(problems) > 0:
+        raise ArtifactError(problems)
+    for header in headers:
+        logger.debug("Verified {0} ({1} files).".format(header.nevra, \
+                                                        len(header.files())))
+    logger.info("Verified {0} packages.".format(len(headers)))
+    return headers
@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+#
+# A build worker that runs `rpmbuild` for HTTPExecutor clients. See
+# `executor.HTTPExecutor` for the protocol. The worker runs whatever spec
+# files it's sent, so bind it only to trusted networks.
+#
+# Usage:
+#   $ packager worker --host 0.0.0.0 --port 8642 --jobs 4
+
+import os
+import json
+import shutil
+import tempfile
+import BaseHTTPServer
+import SocketServer
+from packager.core import log
+from packager.core.runner import Runner
+from packager.rpm.executor import pack, unpack
+
+logger = log.get_logger(__name__)
+
+default_port = 8642
+
+class _ResponseLog(object):
+    '''
+    Passes lines of command output to a worker's client, and to the
+    worker's own log.
+    '''
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def info(self, msg, *args, **kwargs):
+        logger.debug(msg, *args, **kwargs)
+        self.wfile.write("LOG " + msg.encode("utf-8") + "\n")
+        self.wfile.flush()
+
+    debug = info
+    warning = error = info
+
+class BuildHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    Handles POST /build requests.
+    '''
+    def do_POST(self):
+        if self.path.rstrip("/") != "/build":
+            self.send_error(404)
+            return
+        try:
+            args = json.loads(self.headers.getheader("X-Rpmbuild-Args"))
+            size = int(self.headers.getheader("Content-Length"))
+            timeout = self.headers.getheader("X-Timeout")
+            timeout = float(timeout) if timeout else None
+        except (TypeError, ValueError):
+            self.send_error(400, "Missing or malformed build headers")
+            return
+
+        topdir = tempfile.mkdtemp(prefix="packager-", dir=self.server.workdir)
+        try:
+            with tempfile.TemporaryFile() as upload:
+                remaining = size
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, 65536))
+                    if not chunk:
+                        return
+                    upload.write(chunk)
+                    remaining -= len(chunk)
+                upload.seek(0)
+                unpack(upload, topdir)
+            for dname in ["BUILD", "BUILDROOT", "RPMS", "SRPMS"]:
+                os.mkdir(os.path.join(topdir, dname))
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.end_headers()
+
+            logger.info("Building in " + topdir)
+            cmd = self.server.command + args + ["--define", "_topdir " + topdir]
+            job = self.server.runner.start(cmd, log=_ResponseLog(self.wfile), \
+                                           timeout=timeout, cwd=topdir)
+            try:
+                ret = job.wait()
+            except OSError as e:
+                self.wfile.write("LOG " + str(e) + "\n")
+                ret = 127
+            with tempfile.TemporaryFile() as download:
+                pack(topdir, ["RPMS", "SRPMS"], download)
+                nbytes = download.tell()
+                download.seek(0)
+                self.wfile.write("EXIT {0} {1} {2}\n".format(
+                    ret, 1 if job.timed_out else 0, nbytes))
+                shutil.copyfileobj(download, self.wfile)
+            logger.info("Finished build in {0} with status {1}".format(
+                topdir, ret))
+        finally:
+            shutil.rmtree(topdir, ignore_errors=True)
+
+    def log_message(self, format, *args):
+        logger.info(self.address_string() + " - " + format % args)
+
+class Worker(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    An HTTP server that runs builds in threads, no more than `jobs` at
+    once, in temporary directories under `workdir`.
+    '''
+    daemon_threads = True
+
+    def __init__(self, address, jobs=1, workdir=None, \
+                 command=("rpmbuild",)):
+        BaseHTTPServer.HTTPServer.__init__(self, address, BuildHandler)
+        self.runner = Runner(max_jobs=jobs)
+        self.workdir = workdir
+        self.command = list(command)
+
+def serve(host="127.0.0.1", port=default_port, jobs=1, workdir=None):
+    '''
+    Runs a build worker until interrupted.
+    '''
+    worker = Worker((host, port), jobs=jobs, workdir=workdir)
+    logger.info("Worker listening on {0}:{1}".format(*worker.server_address))
+    try:
+        worker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.runner.cancel()
+        worker.server_close()
@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+#
+# Tests for the command-line interface. The startup times of the
+# commands depend on the load on the machine, so they're not checked by
+# the tests; run this file to print them, and to exit with an error if
+# any is over `max_startup_time`:
+#   $ python packager/test/test_cli.py
+#
+# `plan` is timed on a local module with no dependencies. `check-deps`
+# is timed on a package list, made with the module, naming one package;
+# it queries `rpm` (or `dpkg-query`) for it whether or not it's installed.
+
+from packager import cli
+from nose.tools import *
+from nose import with_setup
+import os, shutil
+import sys
+import time
+import tempfile
+import subprocess
+import packager
+
+heavy_modules = ["urllib", "urllib2", "zipfile", "tarfile", "subprocess",
+                 "cProfile", "pstats", "packager.core.module",
+                 "packager.core.repo_tools", "packager.rpm.build"]
+
+commands = [
+    ("build_rpm --version", "from packager.cli import build_rpm",
+     "build_rpm(['--version'])"),
+    ("build_rpm --help", "from packager.cli import build_rpm",
+     "build_rpm(['--help'])"),
+    ("packager --help", "from packager.cli import main", "main(['--help'])"),
+    ("packager cache stats", "from packager.cli import main",
+     "main(['cache', 'stats', '--cache', {0!r}])"),
+    ("packager plan", "from packager.cli import main",
+     "main(['plan', 'hydrotrend', '--local', {0!r}])"),
+    ("packager check-deps", "from packager.cli import main\n"
+     "from packager.core import check_dependencies\n"
+     "check_dependencies.__file__ = "
+     "{0!r} + '/check_dependencies.py'",
+     "main(['check-deps'])"),
+    ]
+
+# Most a command may add to the interpreter's startup time, in seconds.
+max_startup_time = 0.2
+
+def make_module(repo_dir):
+    '''
+    Makes a module, "hydrotrend", that `plan` can find with --local,
+    and the package lists `check-deps` reads from the config directory.
+    '''
+    module_dir = os.path.join(repo_dir, "hydrotrend")
+    os.mkdir(module_dir)
+    os.mkdir(os.path.join(repo_dir, "config"))
+    for fname in ("dependencies.txt", "dependencies_debian.txt"):
+        with open(os.path.join(repo_dir, "config", fname), "w") as f:
+            f.write("# Dependencies\nbash\n")
+    for fname, text in [("hydrotrend.spec", "Name: hydrotrend\n"
+                         "Version: %{_version}\n"
+                         "Source0: hydrotrend-%{_version}.tar.gz\n"),
+                        ("dependencies.txt", "# Dependencies\n")]:
+        with open(os.path.join(module_dir, fname), "w") as f:
+            f.write(text)
+
+# Setup fixture
+def setup_func():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+    make_module(tmp_dir)
+
+# Teardown fixture
+def teardown_func():
+    shutil.rmtree(tmp_dir)
+
+def python(code):
+    '''
+    Runs Python code in a new interpreter, returning its output and the
+    wall time taken.
+    '''
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(packager.__file__))
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, "-c", code], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = proc.communicate()[0]
+    return output, time.time() - start
+
+def startup_time(setup, stmt, repeat=5):
+    '''
+    Returns the best of `repeat` wall times for running a command in a
+    new interpreter.
+    '''
+    return min(python(setup + "\ntry:\n    " + stmt \
+                      + "\nexcept (SystemExit, EnvironmentError):\n"
+                      "    pass")[1] \
+               for i in range(repeat))
+
+def test_import_is_light():
+    output, secs = python("import sys, packager.cli\n"
+                          "print(' '.join(sorted(sys.modules)))")
+    loaded = output.split()
+    for name in heavy_modules:
+        assert_false(name in loaded, name + " imported at startup")
+
+def test_version():
+    output, secs = python("from packager.cli import build_rpm\n"
+                          "build_rpm(['--version'])")
+    assert_true(output.strip().startswith("build_rpm "))
+
+def test_plan_parser():
+    args = cli.packager_parser().parse_args(["plan", "hydrotrend",
+                                             "--local", "rpm_models"])
+    assert_equal(args.func, cli.plan)
+    assert_equal(args.module_name, "hydrotrend")
+
+@raises(SystemExit)
+def test_plan_needs_module():
+    args = cli.packager_parser().parse_args(["plan"])
+    cli.selected_modules(args.parser, args)
+
+def test_build_all_skips_dependents():
+    from packager.core.errors import BuildError
+    built = []
+    def build(name):
+        if name == "babel":
+            raise BuildError("Error in building module RPM.")
+        built.append(name)
+    modules = [("babel", []), ("cem", ["babel"]), ("child", ["cem"]),
+               ("hydrotrend", [])]
+    status, skipped = cli.build_all(modules, build)
+    assert_equal(built, ["hydrotrend"])
+    assert_equal(skipped, ["cem", "child"])
+    assert_equal(status, BuildError.exit_status)
+
+@raises(SystemExit)
+def test_build_rpm_needs_module():
+    cli.build_rpm([])
+
+@raises(SystemExit)
+def test_build_rpm_buildroot_needs_local_executor():
+    cli.build_rpm(["hydrotrend", "--buildroot",
+                   "--executor", "ssh://buildhost"])
+
+@with_setup(setup_func, teardown_func)
+def test_cache_stats():
+    output, secs = python("from packager.cli import main\n"
+                          "main(['cache', 'stats', '--cache', "
+                          + repr(tmp_dir) + "])")
+    assert_true(("Cache: " + tmp_dir) in output)
+    assert_true(" - sources: 0 entries" in output)
+
+def main():
+    '''
+    Prints the startup time of each command, less the startup time of
+    the interpreter. Returns 1 if any is over `max_startup_time`.
+    '''
+    tmp_dir = tempfile.mkdtemp()
+    make_module(tmp_dir)
+    status = 0
+    try:
+        baseline = startup_time("", "pass")
+        print("{0:24s} {1:6.1f} ms".format("python", baseline * 1e3))
+        for name, setup, stmt in commands:
+            secs = startup_time(setup.format(tmp_dir), stmt.format(tmp_dir))
+            slow = secs - baseline >= max_startup_time
+            print("{0:24s} {1:6.1f} ms{2}".format(name,
+                  (secs - baseline) * 1e3, " (too slow)" if slow else ""))
+            if slow:
+                status = 1
+    finally:
+        shutil.rmtree(tmp_dir)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
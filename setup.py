@@ -1,5 +1,3 @@
-from ez_setup import use_setuptools # https://pypi.python.org/pypi/setuptools
-use_setuptools()
 from setuptools import setup, find_packages
 from packager import __version__
 
@@ -35,13 +33,15 @@ setup(
         ],
     keywords='CSDMS, earth system modeling, packaging, Linux, rpm, deb',
     packages=find_packages(exclude=['*test']),
-    install_requires=['nose'],
+    tests_require=['nose'],
+    test_suite='nose.collector',
     package_data={
         'packager': ['repositories.txt'],
         },
     entry_points={
         'console_scripts': [
-            'build_rpm=packager.rpm.build:main',
+            'build_rpm=packager.cli:build_rpm',
+            'packager=packager.cli:main',
             ],
         },
     )